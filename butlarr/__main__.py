@@ -1,41 +1,116 @@
+import asyncio
+
 from loguru import logger
 from telegram import Update
 from telegram.ext import Application
 
 from .database import Database
 from .config.secrets import TELEGRAM_TOKEN
+from .config.telegram import (
+    API_URL,
+    CONCURRENT_UPDATES,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+    UPDATE_QUEUE_SIZE,
+)
 from .config.services import SERVICES
+from .services import ArrService, close_async_clients, start_services
+from .services.queue import AggregatedQueue
 from .tg_handler import get_clbk_handler, get_common_handlers
 from .tg_handler.auth import get_auth_handler
+from .tg_handler.message import poster_cache
+from .snapshot import Snapshot
+
+snapshot = Snapshot(SERVICES)
 
 
 def init():
     pass
 
 
+async def startup(application):
+    # Services are probed in the background, the bot is usable right away
+    application.bot_data["startup"] = asyncio.get_running_loop().create_task(
+        start_services(SERVICES)
+    )
+    snapshot.start()
+
+
+async def shutdown(application):
+    logger.info("Saving snapshot...")
+    snapshot.stop()
+    snapshot.save()
+    logger.info("Closing service connections...")
+    await close_async_clients()
+    logger.info("Persisting session data...")
+    ArrService.session_db.close()
+    poster_cache.close()
+
+
 def main():
     logger.info("Initializing database...")
     db = Database()
 
+    logger.info("Restoring snapshot...")
+    snapshot.load()
+
     logger.info("Creating bot...")
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(startup)
+        .post_shutdown(shutdown)
+    )
+    if API_URL:
+        builder = builder.base_url(f"{API_URL.rstrip('/')}/bot").base_file_url(
+            f"{API_URL.rstrip('/')}/file/bot"
+        )
+    application = builder.build()
 
     logger.info("Registering auth command...")
     application.add_handler(get_auth_handler(db))
 
+    # Combined queue of all services, next to the per-service queues
+    handlers = [*SERVICES, AggregatedQueue(SERVICES)]
+
     logger.info("Registering start & help commands...")
-    for h in get_common_handlers(SERVICES):
+    for h in get_common_handlers(handlers):
         application.add_handler(h)
 
     logger.info("Registering services..")
-    for s in SERVICES:
+    for s in handlers:
         s.register(application, db)
 
     logger.info("Registering callback handler...")
-    application.add_handler(get_clbk_handler(SERVICES))
+    application.add_handler(get_clbk_handler(handlers))
+
+    if WEBHOOK_URL:
+        if not WEBHOOK_SECRET_TOKEN:
+            logger.warning(
+                "No webhook secret token configured! Anyone knowing the url can send updates to the bot."
+            )
+        logger.info(
+            f"Listening for webhook updates on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}.."
+        )
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        logger.info("Start polling for messages..")
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
-    logger.info("Start polling for messages..")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    logger.info("Closing database...")
+    db.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+import asyncio
+import re
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+MISSING = object()
+
+ID_TERM_REGEX = re.compile(r"^\s*(tmdb|tvdb|imdb):\s*\S+\s*$", re.IGNORECASE)
+PUNCTUATION_REGEX = re.compile(r"[^\w\s]+")
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def normalize_term(term: str) -> str:
+    """Folds case, punctuation and whitespace of a search term."""
+    if ID_TERM_REGEX.match(term):
+        # Id lookups (e.g. "tmdb:123") rely on their punctuation
+        return WHITESPACE_REGEX.sub("", term).lower()
+    term = PUNCTUATION_REGEX.sub(" ", term.casefold())
+    return WHITESPACE_REGEX.sub(" ", term).strip()
+
+
+def _is_empty(value) -> bool:
+    return value is None or (hasattr(value, "__len__") and not len(value))
+
+
+class TTLCache:
+    """
+    LRU cache with per-entry expiry.
+    Empty values are cached as well (negative caching), but for a shorter
+    `negative_ttl`.
+    """
+
+    max_entries: int
+    ttl: float
+    negative_ttl: float
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600, negative_ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: Hashable, default=MISSING):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        if _is_empty(value):
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value, ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = self.negative_ttl if _is_empty(value) else self.ttl
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    def dump(self) -> List[Tuple[Hashable, float, Any]]:
+        """Live entries with their remaining ttl, least recently used first"""
+        now = time.monotonic()
+        return [(k, exp - now, v) for k, (exp, v) in self.entries.items() if exp > now]
+
+    def load(self, entries: List[Tuple[Hashable, float, Any]], age: float = 0):
+        """Restores dumped entries, `age` seconds after they were dumped"""
+        for key, ttl, value in entries:
+            if ttl > age:
+                self.set(key, value, ttl - age)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (
+                (self.hits + self.negative_hits) / lookups if lookups else 0.0
+            ),
+        }
+
+
+class AsyncTTLCache(TTLCache):
+    """
+    TTLCache with single-flight fetching: concurrent misses for the same key
+    share a single call of the fetch function.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.shared_fetches = 0
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        try:
+            value = await fetch()
+            # None signals a failed fetch, which must not be cached
+            if value is not None:
+                self.set(key, value)
+            return value
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        task = self.in_flight.get(key)
+        if task:
+            self.shared_fetches += 1
+        else:
+            task = asyncio.get_running_loop().create_task(self._fetch(key, fetch))
+            self.in_flight[key] = task
+        # Shielded, so a cancelled waiter does not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "in_flight": len(self.in_flight),
+            "shared_fetches": self.shared_fetches,
+        }
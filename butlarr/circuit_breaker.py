@@ -0,0 +1,96 @@
+import time
+
+from enum import Enum
+from loguru import logger
+
+
+class ServiceUnavailableError(Exception):
+    def __init__(self, service: str, retry_in: float = 0):
+        self.service = service
+        self.retry_in = retry_in
+        super().__init__(
+            f"The {service} service is currently unavailable. Please try again in {max(1, round(retry_in))}s."
+        )
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after `failure_threshold` consecutive failures.
+    Once `reset_timeout` seconds passed, a single probe request is let
+    through. A successful probe closes the breaker again, a failed one
+    re-opens it. A probe without outcome (e.g. cancelled) is released, or
+    replaced by a new one after another `reset_timeout`.
+    """
+
+    name: str
+    failure_threshold: int
+    reset_timeout: float
+    state: BreakerState
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow_request(self) -> bool:
+        if self.state == BreakerState.CLOSED:
+            return True
+        probe_expired = (
+            self.state == BreakerState.HALF_OPEN
+            and time.monotonic() - self.probe_started >= self.reset_timeout
+        )
+        if (self.state == BreakerState.OPEN and not self.retry_in()) or probe_expired:
+            logger.info(f"Circuit of {self.name} half open, probing service...")
+            self.state = BreakerState.HALF_OPEN
+            self.probe_started = time.monotonic()
+            return True
+        # Either still open, or another request is already probing
+        return False
+
+    def check(self):
+        if not self.allow_request():
+            raise ServiceUnavailableError(self.name, self.retry_in())
+
+    def record_success(self):
+        if self.state != BreakerState.CLOSED:
+            logger.info(f"Circuit of {self.name} closed, service is reachable again")
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+
+    def release(self):
+        """Gives up a probe without outcome, the next request probes again"""
+        if self.state == BreakerState.HALF_OPEN:
+            self.state = BreakerState.OPEN
+
+    def trip(self):
+        """Opens the breaker right away, e.g. for a service that never answered"""
+        if self.state != BreakerState.OPEN:
+            logger.warning(f"Circuit of {self.name} opened")
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+
+    def record_failure(self):
+        self.failures += 1
+        if (
+            self.state == BreakerState.HALF_OPEN
+            or self.failures >= self.failure_threshold
+        ):
+            if self.state != BreakerState.OPEN:
+                logger.warning(
+                    f"Circuit of {self.name} opened after {self.failures} failures"
+                )
+            self.state = BreakerState.OPEN
+            self.opened_at = time.monotonic()
@@ -48,7 +48,14 @@ def _inject_service_conf(config):
             config["services"].append({})
         config["services"][indexes[name]][field] = value
 
-    options = [("api", "_API"), ("type", "_TYPE"), ("name", "_NAME")]
+    options = [
+        ("api", "_API"),
+        ("type", "_TYPE"),
+        ("name", "_NAME"),
+        ("connect_timeout", "_CONNECT_TIMEOUT"),
+        ("read_timeout", "_READ_TIMEOUT"),
+        ("retries", "_RETRIES"),
+    ]
     for key, val in service_envs:
         for field, suffix in options:
             if key.endswith(suffix):
@@ -58,7 +65,7 @@ def _inject_service_conf(config):
                 update_config(key, v, field, "BUTLARR_SERVICES_", suffix)
 
     def update_config(key, value, field, prefix, suffix):
-        (name, idx) = key.removeprefix(prefix).replace(suffix, "_").rsplit("_", 1)
+        name, idx = key.removeprefix(prefix).replace(suffix, "_").rsplit("_", 1)
         idx = int(idx)
         name = name.lower()
         check_indexes(name)
@@ -84,6 +91,16 @@ def load_config_from_env():
     config = {
         "telegram": {
             "token": os.getenv("TELEGRAM_BOT_TOKEN"),
+            "api_url": os.getenv("TELEGRAM_BOT_API_URL"),
+            "concurrent_updates": os.getenv("BUTLARR_CONCURRENT_UPDATES"),
+            "webhook": {
+                "url": os.getenv("BUTLARR_WEBHOOK_URL"),
+                "listen": os.getenv("BUTLARR_WEBHOOK_LISTEN"),
+                "port": os.getenv("BUTLARR_WEBHOOK_PORT"),
+                "path": os.getenv("BUTLARR_WEBHOOK_PATH"),
+                "secret_token": os.getenv("BUTLARR_WEBHOOK_SECRET_TOKEN"),
+                "max_queue_size": os.getenv("BUTLARR_WEBHOOK_MAX_QUEUE_SIZE"),
+            },
         },
         "auth_passwords": {
             "admin": os.getenv("BUTLARR_ADMIN_PASSWORD"),
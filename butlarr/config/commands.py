@@ -1,3 +1,4 @@
 HELP_COMMAND = "help"
 START_COMMAND = "start"
 AUTH_COMMAND = "auth"
+QUEUE_COMMAND = "queue"
@@ -1,2 +1,10 @@
 WIDTH = 20
 PAGE_SIZE = 10
+# Seconds between refreshes of live queue messages
+LIVE_INTERVAL = 10
+# Live queue messages stop updating after this many seconds without interaction
+LIVE_TIMEOUT = 10 * 60
+# Max. number of records fetched per service for the combined queue
+AGGREGATE_FETCH_SIZE = 250
+# Seconds to wait for a service before leaving it out of the combined queue
+AGGREGATE_TIMEOUT = 10
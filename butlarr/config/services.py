@@ -20,5 +20,8 @@ for service in CONFIG["services"]:
         "api_host": api_config["api_host"],
         "api_key": api_config["api_key"],
     }
+    for option in ["connect_timeout", "read_timeout", "retries"]:
+        if option in service:
+            args[option] = service[option]
 
     SERVICES.append(ServiceConstructor(**args))
@@ -0,0 +1,20 @@
+from . import CONFIG
+
+# Number of updates handled at once, updates of the same chat & service
+# are still handled one after another
+CONCURRENT_UPDATES = int(CONFIG["telegram"].get("concurrent_updates") or 16)
+
+# Optional alternative Bot API server, e.g. a self-hosted one
+API_URL = CONFIG["telegram"].get("api_url")
+
+# Updates are received through a webhook if an url is configured,
+# otherwise through long polling
+WEBHOOK = CONFIG["telegram"].get("webhook") or {}
+WEBHOOK_URL = WEBHOOK.get("url")
+WEBHOOK_LISTEN = WEBHOOK.get("listen") or "0.0.0.0"
+WEBHOOK_PORT = int(WEBHOOK.get("port") or 8443)
+WEBHOOK_PATH = WEBHOOK.get("path") or ""
+WEBHOOK_SECRET_TOKEN = WEBHOOK.get("secret_token")
+
+# Updates waiting to be handled, receiving blocks once it is full
+UPDATE_QUEUE_SIZE = int(WEBHOOK.get("max_queue_size") or 256)
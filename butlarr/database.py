@@ -1,13 +1,21 @@
+import asyncio
 import os
+import queue
+import sqlite3
+import threading
+
+from concurrent.futures import Future
 from pathlib import Path
 from loguru import logger
-import sqlite3
-from threading import Lock
+from typing import Callable, Dict, Optional
 
 DEFAULT_PATH = os.path.join(
     Path(os.path.dirname(os.path.realpath(__file__))).parent, "data", "db.sqlite"
 )
 
+# Number of prepared statements sqlite keeps around for reuse
+STATEMENT_CACHE_SIZE = 64
+
 
 def _dict_factory(cursor, row):
     d = {}
@@ -17,34 +25,88 @@ def _dict_factory(cursor, row):
 
 
 class Database:
-    lock = Lock()
-    db_file: Path
-    file: str
-
-    def _get_con_cur(self):
-        # Connect to local DB and return tuple containing connection and cursor
-        try:
-            con = sqlite3.connect(self.db_file, timeout=30)
-            con.execute("PRAGMA journal_mode = off;")
-            con.row_factory = _dict_factory
-            cur = con.cursor()
-            logger.debug(f"Database connection established [{self.db_file}].")
-        except sqlite3.Error as e:
-            logger.error(f"Error connecting to database: {e}")
-            raise
+    """
+    Users database.
+    All queries run on a single worker thread owning one long-lived
+    connection, so callers on the event loop never block on disk I/O.
+    The `a`-prefixed methods can be awaited, the others block until done.
+    """
 
-        return (con, cur)
+    db_file: Path
+    # In-memory copy of the users table: user id -> auth level
+    auth_levels: Dict[int, int]
 
     def __init__(self, db_file=DEFAULT_PATH):
         self.db_file = Path(db_file)
         # Make sure the file exists
         self.db_file.parent.mkdir(exist_ok=True, parents=True)
         self.db_file.touch(exist_ok=True)
+
+        self.jobs: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self.con: Optional[sqlite3.Connection] = None
+        self.worker = threading.Thread(
+            target=self._work, name="butlarr-db", daemon=True
+        )
+        self.worker.start()
+
         # Initialize the db
-        self._init_db()
+        self._submit(self._init_db).result()
+        self._load_auth_levels()
 
-    def _init_db(self):
-        con, cur = self._get_con_cur()
+    def _connect(self):
+        # Connect to local DB, only ever called on the worker thread
+        try:
+            con = sqlite3.connect(
+                self.db_file,
+                timeout=30,
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            con.execute("PRAGMA journal_mode = WAL;")
+            con.execute("PRAGMA synchronous = NORMAL;")
+            con.row_factory = _dict_factory
+            logger.debug(f"Database connection established [{self.db_file}].")
+        except sqlite3.Error as e:
+            logger.error(f"Error connecting to database: {e}")
+            raise
+        return con
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fn, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.con is None:
+                    self.con = self._connect()
+                future.set_result(fn(self.con))
+            except BaseException as e:
+                future.set_exception(e)
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+    def _submit(self, fn: Callable[[sqlite3.Connection], object]) -> Future:
+        future: Future = Future()
+        self.jobs.put((fn, future))
+        return future
+
+    def _run(self, fn: Callable[[sqlite3.Connection], object]):
+        return self._submit(fn).result()
+
+    async def _arun(self, fn: Callable[[sqlite3.Connection], object]):
+        return await asyncio.wrap_future(self._submit(fn))
+
+    def close(self):
+        if self.worker.is_alive():
+            self.jobs.put(None)
+            self.worker.join()
+
+    @staticmethod
+    def _init_db(con):
         queries = [
             """CREATE TABLE IF NOT EXISTS users (
                 id integer primary key,
@@ -55,74 +117,102 @@ class Database:
         for q in queries:
             logger.debug(f"Executing query: [{q}] with no args...")
             try:
-                with self.lock:
-                    cur.execute(q)
+                con.execute(q)
             except sqlite3.Error as e:
                 logger.error(f"Error executing database query [{q}]: {e}")
                 raise
-
         con.commit()
-        con.close()
 
-    def _execute_query(self, q, qa=()):
-        con, cur = self._get_con_cur()
-        logger.debug(f"Executing query: [{q}] with args: [{qa}]")
-        try:
-            with self.lock:
-                r = cur.execute(q, qa)
-                return (r, con)
-        except sqlite3.Error as e:
-            logger.error(f"Error executing database query [{q}]: {e}")
-            raise
+    def _load_auth_levels(self):
+        q = "SELECT id, auth_level FROM users;"
+        self.auth_levels = {u["id"]: u["auth_level"] for u in self._run(self._query(q))}
+        logger.debug(f"Loaded auth levels of {len(self.auth_levels)} users.")
 
-    def add_user(self, id, username, auth_level):
+    @staticmethod
+    def _query(q, qa=(), commit=False):
+        # Returns a job executing the query, run it with `_run` or `_arun`
+        def job(con):
+            logger.debug(f"Executing query: [{q}] with args: [{qa}]")
+            try:
+                records = con.execute(q, qa).fetchall()
+                if commit:
+                    con.commit()
+                return records
+            except sqlite3.Error as e:
+                logger.error(f"Error executing database query [{q}]: {e}")
+                raise
+
+        return job
+
+    def _add_user_query(self, id, username, auth_level):
         q = "INSERT OR REPLACE INTO users (id, username, auth_level) VALUES (?, ?, ?);"
-        qa = (id, username, auth_level)
-        (_, con) = self._execute_query(q, qa)
-        con.commit()
-        con.close()
+        return self._query(q, (id, username, auth_level), commit=True)
+
+    def add_user(self, id, username, auth_level):
+        self._run(self._add_user_query(id, username, auth_level))
+        self.auth_levels[id] = auth_level
+
+    async def aadd_user(self, id, username, auth_level):
+        await self._arun(self._add_user_query(id, username, auth_level))
+        self.auth_levels[id] = auth_level
+
+    def _remove_user_query(self, id):
+        return self._query("DELETE FROM users where id=?;", (id,), commit=True)
 
     def remove_user(self, id):
-        q = "DELETE FROM users where id=?;"
-        qa = (id,)
-        (_, con) = self._execute_query(q, qa)
-        con.commit()
-        con.close()
+        self._run(self._remove_user_query(id))
+        self.auth_levels.pop(id, None)
+
+    async def aremove_user(self, id):
+        await self._arun(self._remove_user_query(id))
+        self.auth_levels.pop(id, None)
+
+    def _get_users_query(self, auth_level=None, min_auth_level=None):
+        if min_auth_level:
+            return self._query(
+                "SELECT * FROM users where auth_level >= ?;", (min_auth_level,)
+            )
+        if auth_level:
+            return self._query(
+                "SELECT * FROM users where auth_level == ?;", (auth_level,)
+            )
+        return self._query("SELECT * FROM users;")
 
     def get_users(
         self,
         auth_level=None,
         min_auth_level=None,
     ):
-        auth_check = (
-            f">= {min_auth_level}"
-            if min_auth_level
-            else f"== {auth_level}" if auth_level else ""
-        )
-        q = f"SELECT * FROM users where auth_level {auth_check}"
-        (r, con) = self._execute_query(q)
-        records = r.fetchall() if r else []
+        records = self._run(self._get_users_query(auth_level, min_auth_level))
         logger.debug(f"Found {len(records)} users in the database.")
-        con.close()
         return records
 
-    def update_auth_level(self, user_id, auth_level=1):
+    async def aget_users(
+        self,
+        auth_level=None,
+        min_auth_level=None,
+    ):
+        records = await self._arun(self._get_users_query(auth_level, min_auth_level))
+        logger.debug(f"Found {len(records)} users in the database.")
+        return records
+
+    def _update_auth_level_query(self, user_id, auth_level):
         q = "UPDATE users set auth_level=? where id=?;"
-        qa = (auth_level, user_id)
-        (_, con) = self._execute_query(q, qa)
-        con.commit()
-        con.close()
+        return self._query(q, (auth_level, user_id), commit=True)
+
+    def update_auth_level(self, user_id, auth_level=1):
+        self._run(self._update_auth_level_query(user_id, auth_level))
+        if user_id in self.auth_levels:
+            self.auth_levels[user_id] = auth_level
+
+    async def aupdate_auth_level(self, user_id, auth_level=1):
+        await self._arun(self._update_auth_level_query(user_id, auth_level))
+        if user_id in self.auth_levels:
+            self.auth_levels[user_id] = auth_level
 
     def get_auth_level(self, user_id):
-        q = "SELECT * FROM users WHERE id=?;"
-        qa = (user_id,)
-        (r, con) = self._execute_query(q, qa)
-
-        record = r.fetchone() if r else None
-        logger.debug(f"Query result for user lookup: {record}")
-        con.close()
-        if record and record["id"] == user_id:
-            return record["auth_level"]
-
-        logger.debug(f"Did not find user [{user_id}] in the database.")
-        return None
+        # Served from memory, all writes go through this class
+        auth_level = self.auth_levels.get(user_id)
+        if auth_level is None:
+            logger.debug(f"Did not find user [{user_id}] in the database.")
+        return auth_level
@@ -0,0 +1,147 @@
+import codecs
+import json
+import re
+
+from typing import Any, Dict, Iterable, List, Optional
+
+WHITESPACE_REGEX = re.compile(r"[ \t\n\r]*")
+
+# Parser states
+_START = 0
+_OBJECT = 1
+_ARRAY = 2
+_DONE = 3
+
+
+class JsonStreamError(ValueError):
+    pass
+
+
+class _Incomplete(Exception):
+    pass
+
+
+class RecordDecoder:
+    """
+    Incrementally decodes the records of a JSON array, fed in chunks.
+    The array is either the whole document, or the `key` member of a
+    top level object (e.g. the `records` of a paged response), whose other
+    members end up in `meta`.
+    Only one record at a time is held in full, records only keep `fields`
+    if given.
+    """
+
+    key: Optional[str]
+    fields: Optional[List[str]]
+
+    def __init__(
+        self, key: Optional[str] = None, fields: Optional[Iterable[str]] = None
+    ):
+        self.key = key
+        self.fields = list(fields) if fields is not None else None
+        self.meta: Dict[str, Any] = {}
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.state = _START
+
+    def _skip(self, chars: str = "") -> Optional[str]:
+        """Skips whitespace (and `chars`), returns the next char if buffered"""
+        while True:
+            self.pos = WHITESPACE_REGEX.match(self.buffer, self.pos).end()
+            if self.pos >= len(self.buffer):
+                return None
+            char = self.buffer[self.pos]
+            if char not in chars:
+                return char
+            self.pos += 1
+
+    def _decode(self):
+        """Decodes the next value, raises _Incomplete until it is fully buffered"""
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            raise _Incomplete()
+        if end == len(self.buffer) and not isinstance(value, (dict, list, str)):
+            # Numbers and literals might continue in the next chunk
+            raise _Incomplete()
+        self.pos = end
+        return value
+
+    def _trim(self, record):
+        if self.fields is None or not isinstance(record, dict):
+            return record
+        return {f: record[f] for f in self.fields if f in record}
+
+    def _parse(self) -> List[Any]:
+        records = []
+        try:
+            while self.state != _DONE:
+                if self.state == _START:
+                    char = self._skip()
+                    if char is None:
+                        break
+                    expected = "{" if self.key else "["
+                    if char != expected:
+                        raise JsonStreamError(f"Expected '{expected}', got '{char}'")
+                    self.pos += 1
+                    self.state = _OBJECT if self.key else _ARRAY
+                elif self.state == _OBJECT:
+                    char = self._skip(",")
+                    if char is None:
+                        break
+                    if char == "}":
+                        self.pos += 1
+                        self.state = _DONE
+                        continue
+                    start = self.pos
+                    try:
+                        name = self._decode()
+                        char = self._skip()
+                        if char != ":":
+                            if char is None:
+                                raise _Incomplete()
+                            raise JsonStreamError(f"Expected ':', got '{char}'")
+                        self.pos += 1
+                        char = self._skip()
+                        if char is None:
+                            raise _Incomplete()
+                        if name == self.key and char == "[":
+                            self.pos += 1
+                            self.state = _ARRAY
+                            continue
+                        # Other members, or no list (e.g. null) under the key
+                        self.meta[name] = self._decode()
+                    except _Incomplete:
+                        self.pos = start
+                        raise
+                elif self.state == _ARRAY:
+                    char = self._skip(",")
+                    if char is None:
+                        break
+                    if char == "]":
+                        self.pos += 1
+                        self.state = _OBJECT if self.key else _DONE
+                        continue
+                    records.append(self._trim(self._decode()))
+        except _Incomplete:
+            pass
+
+        # Drop everything decoded so far
+        self.buffer = self.buffer[self.pos :]
+        self.pos = 0
+        return records
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Returns the records completed by the chunk"""
+        self.buffer += self.text_decoder.decode(chunk)
+        return self._parse()
+
+    def close(self) -> List[Any]:
+        """Returns the remaining records, raises if the document is incomplete"""
+        self.buffer += self.text_decoder.decode(b"", final=True)
+        records = self._parse()
+        if self.state != _DONE or self.buffer.strip():
+            raise JsonStreamError("Incomplete or invalid JSON document")
+        return records
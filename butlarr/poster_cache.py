@@ -0,0 +1,232 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+from loguru import logger
+from typing import Optional
+
+DEFAULT_PATH = os.path.join(
+    Path(os.path.dirname(os.path.realpath(__file__))).parent, "data", "posters.sqlite"
+)
+
+# Bad URLs are retried once in a while, the image might have been fixed
+DEFAULT_BAD_URL_TTL = 24 * 60 * 60
+# Prefetched posters kept in memory until they are sent
+DEFAULT_MAX_PREFETCHED = 32
+# Least recently used file ids and bad URLs beyond these are dropped
+DEFAULT_MAX_POSTERS = 20000
+DEFAULT_MAX_BAD_URLS = 2000
+
+
+class PosterCache:
+    """
+    Remembers the Telegram file_id of every poster URL sent before, so the
+    same image is not downloaded by Telegram over and over again.
+    URLs Telegram could not use are remembered as well, so sends go
+    straight to the fallback poster.
+    Posters downloaded ahead of time are held in memory until first sent.
+    The SQLite file is loaded and written on a worker thread, started on
+    first use, which commits queued changes in batches.
+    """
+
+    db_file: Optional[Path]
+    bad_url_ttl: float
+
+    def __init__(
+        self,
+        db_file=DEFAULT_PATH,
+        *,
+        bad_url_ttl: float = DEFAULT_BAD_URL_TTL,
+        max_prefetched: int = DEFAULT_MAX_PREFETCHED,
+        max_posters: int = DEFAULT_MAX_POSTERS,
+        max_bad_urls: int = DEFAULT_MAX_BAD_URLS,
+        persist: bool = True,
+    ):
+        self.db_file = Path(db_file) if persist else None
+        self.bad_url_ttl = bad_url_ttl
+        self.max_prefetched = max_prefetched
+        self.max_posters = max_posters
+        self.max_bad_urls = max_bad_urls
+        self.prefetched: OrderedDict[str, bytes] = OrderedDict()
+        self.file_ids: OrderedDict[str, str] = OrderedDict()
+        # url -> unix time from which the url is retried
+        self.bad_urls: OrderedDict[str, float] = OrderedDict()
+        # Guards the dicts while the worker merges the loaded entries
+        self.lock = threading.Lock()
+        self.writes: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self.worker: Optional[threading.Thread] = None
+
+    def _start(self):
+        if self.worker or not self.db_file:
+            return
+        self.worker = threading.Thread(
+            target=self._work, name="butlarr-posters", daemon=True
+        )
+        self.worker.start()
+
+    def close(self):
+        """Writes the queued changes and stops the worker"""
+        if self.worker and self.worker.is_alive():
+            self.writes.put(None)
+            self.worker.join()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        try:
+            self.db_file.parent.mkdir(exist_ok=True, parents=True)
+            con = sqlite3.connect(self.db_file, check_same_thread=False)
+            con.execute("PRAGMA journal_mode = WAL;")
+            with con:
+                con.execute("""CREATE TABLE IF NOT EXISTS posters (
+                        url text primary key,
+                        file_id text
+                    );""")
+                con.execute("""CREATE TABLE IF NOT EXISTS bad_posters (
+                        url text primary key,
+                        expires_at real not null
+                    );""")
+                con.execute(
+                    "DELETE FROM bad_posters WHERE expires_at < ?;", (time.time(),)
+                )
+            self._load(con)
+            return con
+        except sqlite3.Error as e:
+            logger.error(f"Error loading poster cache, not persisting posters: {e}")
+            return None
+
+    def _load(self, con: sqlite3.Connection):
+        # Oldest first, so the LRU order survives restarts
+        file_ids = OrderedDict(
+            con.execute("SELECT url, file_id FROM posters ORDER BY rowid;")
+        )
+        bad_urls = OrderedDict(
+            con.execute("SELECT url, expires_at FROM bad_posters ORDER BY rowid;")
+        )
+        with self.lock:
+            # Entries set while loading are newer than the stored ones
+            file_ids.update(self.file_ids)
+            bad_urls.update(self.bad_urls)
+            self.file_ids, self.bad_urls = file_ids, bad_urls
+            dropped = self._trim()
+        self._apply(con, dropped)
+        logger.debug(
+            f"Loaded {len(self.file_ids)} cached and {len(self.bad_urls)} bad posters."
+        )
+
+    def _trim(self):
+        """Drops the least recently used entries beyond the limits"""
+        dropped = []
+        while len(self.file_ids) > self.max_posters:
+            url, _ = self.file_ids.popitem(last=False)
+            dropped.append(("DELETE FROM posters WHERE url=?;", (url,)))
+        while len(self.bad_urls) > self.max_bad_urls:
+            url, _ = self.bad_urls.popitem(last=False)
+            dropped.append(("DELETE FROM bad_posters WHERE url=?;", (url,)))
+        return dropped
+
+    @staticmethod
+    def _apply(con: sqlite3.Connection, writes):
+        if not writes:
+            return
+        try:
+            with con:
+                for q, qa in writes:
+                    con.execute(q, qa)
+        except sqlite3.Error as e:
+            logger.error(f"Error persisting poster cache: {e}")
+
+    def _work(self):
+        con = self._connect()
+        stop = False
+        while not stop:
+            writes = [self.writes.get()]
+            # Everything queued in the meantime goes into the same commit
+            while True:
+                try:
+                    writes.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in writes
+            if con:
+                self._apply(con, [w for w in writes if w is not None])
+        if con:
+            con.close()
+
+    def _write(self, q, qa):
+        with self.lock:
+            writes = [(q, qa), *self._trim()]
+        if self.db_file:
+            for write in writes:
+                self.writes.put(write)
+
+    def get_file_id(self, url: str) -> Optional[str]:
+        self._start()
+        with self.lock:
+            file_id = self.file_ids.get(url)
+            if file_id is not None:
+                self.file_ids.move_to_end(url)
+        return file_id
+
+    def set_file_id(self, url: str, file_id: str):
+        self._start()
+        with self.lock:
+            if self.file_ids.get(url) == file_id:
+                return
+            self.file_ids[url] = file_id
+            self.file_ids.move_to_end(url)
+        self._write(
+            "INSERT OR REPLACE INTO posters (url, file_id) VALUES (?, ?);",
+            (url, file_id),
+        )
+
+    def forget_file_id(self, url: str):
+        with self.lock:
+            found = self.file_ids.pop(url, None) is not None
+        if found:
+            self._write("DELETE FROM posters WHERE url=?;", (url,))
+
+    def is_bad(self, url: str) -> bool:
+        self._start()
+        with self.lock:
+            expires_at = self.bad_urls.get(url)
+            if expires_at is None:
+                return False
+            if expires_at < time.time():
+                del self.bad_urls[url]
+                return False
+        return True
+
+    def mark_bad(self, url: str):
+        self._start()
+        self.prefetched.pop(url, None)
+        expires_at = time.time() + self.bad_url_ttl
+        with self.lock:
+            self.bad_urls[url] = expires_at
+            self.bad_urls.move_to_end(url)
+        self._write(
+            "INSERT OR REPLACE INTO bad_posters (url, expires_at) VALUES (?, ?);",
+            (url, expires_at),
+        )
+
+    def has_poster(self, url: str) -> bool:
+        """Whether the poster can be sent without Telegram fetching the url"""
+        return (
+            self.get_file_id(url) is not None
+            or url in self.prefetched
+            or self.is_bad(url)
+        )
+
+    def set_bytes(self, url: str, data: bytes):
+        self.prefetched[url] = data
+        self.prefetched.move_to_end(url)
+        while len(self.prefetched) > self.max_prefetched:
+            self.prefetched.popitem(last=False)
+
+    def get_bytes(self, url: str) -> Optional[bytes]:
+        return self.prefetched.get(url)
+
+    def forget_bytes(self, url: str):
+        self.prefetched.pop(url, None)
@@ -1,10 +1,28 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from functools import cached_property, partial
 from loguru import logger
 from enum import Enum
-from typing import List, Tuple, Optional, Any
-import requests
+from typing import Dict, List, Tuple, Optional, Any
+import asyncio
+import random
+import time
+import httpx
 from ..tg_handler import TelegramHandler
+from ..tg_handler.keyboard import Button
 from ..session_database import SessionDatabase
+from ..circuit_breaker import BreakerState, CircuitBreaker, ServiceUnavailableError
+from ..json_stream import JsonStreamError, RecordDecoder
+from ..cache import MISSING, AsyncTTLCache, TTLCache, normalize_term
+from .prefetch import prefetcher, prefetch_poster
+from .library import LibraryIndex, LETTERS, SORTS, SORT_TITLE
+from .reference import (
+    ReferenceCache,
+    REFERENCE_NAMES,
+    ROOT_FOLDER,
+    QUALITY_PROFILE,
+    LANGUAGE_PROFILE,
+    TAG,
+)
 
 
 def find_first(elems, check, fallback=0):
@@ -36,125 +54,671 @@ class ArrVariant(Enum):
     RADARR = "movie"
 
 
+@dataclass(frozen=True)
+class ItemRef:
+    """
+    Compact reference to a lookup or library item, as stored in session state.
+    The full item is kept in the item cache of the service.
+    """
+
+    key: str
+    title: str = ""
+    year: Optional[int] = None
+    # Library id, only set for items already in the library
+    id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class Listing:
+    """
+    Position of a session within a library listing. Sessions only hold a
+    window of the listing, other windows are loaded from the library index.
+    """
+
+    query: str
+    sort: str
+    # Position of the first item of the window within the listing
+    offset: int
+    total: int
+
+
+# Number of listing items held per session
+LIST_WINDOW_SIZE = 20
+# Items skipped by the fast forward/rewind buttons of listings
+LIST_JUMP_SIZE = 10
+
+
+# Keep-alive clients shared by every service talking to the same host
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+ASYNC_CLIENT_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+
+
+def get_async_client(api_url: str) -> httpx.AsyncClient:
+    url = httpx.URL(api_url)
+    host = f"{url.scheme}://{url.netloc.decode()}"
+    client = _async_clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(base_url=host, limits=ASYNC_CLIENT_LIMITS)
+        _async_clients[host] = client
+    return client
+
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_RETRIES = 2
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_CAP = 5.0
+
+LOOKUP_CACHE_SIZE = 512
+LOOKUP_CACHE_TTL = 30 * 60
+LOOKUP_CACHE_NEGATIVE_TTL = 5 * 60
+
+ITEM_CACHE_SIZE = 4096
+ITEM_CACHE_TTL = 60 * 60
+
+
+def retry_backoff(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2**attempt))
+
+
+async def close_async_clients():
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+# Items per request to the bulk import endpoint
+IMPORT_BATCH_SIZE = 100
+# Adds running at once if there is no bulk import endpoint
+IMPORT_ADD_CONCURRENCY = 4
+
+# Fields of queue records shown by the combined queue
+QUEUE_RECORD_FIELDS = [
+    "id",
+    "title",
+    "size",
+    "sizeleft",
+    "status",
+    "trackedDownloadState",
+    "timeleft",
+]
+
+# Startup probes per service are given up after this many seconds
+STARTUP_TIMEOUT = 10.0
+# Unreachable services are probed again with an exponential backoff
+STARTUP_RETRY_BASE = 15.0
+STARTUP_RETRY_CAP = 5 * 60.0
+
+# Menus listing nothing but reference data, whose keyboards are memoized
+STATIC_MENUS = {
+    "path": ROOT_FOLDER,
+    "quality": QUALITY_PROFILE,
+    "language": LANGUAGE_PROFILE,
+}
+
+
+async def start_services(services: List["ArrService"]):
+    """
+    Probes all services concurrently. Unreachable services stay degraded
+    and keep being retried in the background.
+    """
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *[s.start() for s in services], return_exceptions=True
+    )
+    results = [r is True for r in results]
+    logger.info(
+        f"Started {sum(results)} of {len(services)} services in {time.monotonic() - started:.2f}s"
+    )
+    for service, ok in zip(services, results):
+        if not ok:
+            service.retry_start()
+
+
 class ArrService(TelegramHandler):
     name: str
+    api_host: str
     api_url: str
     api_key: str
-    api_version: str
+    api_version: Optional[str] = None
+    # Set until the service was reached (or restored from a snapshot), later
+    # outages are handled by the circuit breaker
+    degraded: bool = True
+    starting: Optional[asyncio.Task] = None
     service_content: ServiceContent = None
     arr_variant: ArrVariant | str = None
 
-    root_folders: List[str] = []
     session_db: SessionDatabase = SessionDatabase()
+    reference: Optional[ReferenceCache] = None
 
-    def _post(self, endpoint, params={}):
-        return requests.post(
-            f"{self.api_url}/{endpoint}", params={"apikey": self.api_key}, json=params
-        )
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT
+    read_timeout: float = DEFAULT_READ_TIMEOUT
+    retries: int = DEFAULT_RETRIES
+    breaker: Optional[CircuitBreaker] = None
 
-    def _put(self, endpoint, params={}):
-        return requests.put(
-            f"{self.api_url}/{endpoint}", params={"apikey": self.api_key}, json=params
-        )
+    def configure_transport(
+        self,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+    ):
+        if connect_timeout is not None:
+            self.connect_timeout = float(connect_timeout)
+        if read_timeout is not None:
+            self.read_timeout = float(read_timeout)
+        if retries is not None:
+            self.retries = int(retries)
+        self.breaker = CircuitBreaker(self.commands[0])
+
+    def init_api(self, api_host: str):
+        # Only v3 apis are supported, the actual probing happens in `start`
+        self.api_host = api_host.rstrip("/")
+        self.api_url = f"{self.api_host}/api/v3"
+
+    def init_reference_data(self, kinds: List[str]):
+        # Loaded by `start`, so constructing a service never hits the network
+        self.reference = ReferenceCache(self, kinds)
+
+    async def start(self, timeout: float = STARTUP_TIMEOUT) -> bool:
+        """Probes the service and loads its reference data"""
+        name = self.commands[0]
+        started = time.monotonic()
+        try:
+            api_version = await asyncio.wait_for(self.adetect_api(), timeout)
+            if api_version:
+                # Usable right away, the reference data follows
+                self.api_version = api_version
+                self.degraded = False
+            if api_version and self.reference:
+                await asyncio.wait_for(self.reference.refresh(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out probing {name} ({self.api_url})")
+            api_version = None
+        except ServiceUnavailableError as e:
+            logger.warning(e)
+            api_version = None
+        except Exception as e:
+            # e.g. the HTML page of a proxy instead of the api
+            logger.error(f"Error probing {name} ({self.api_url}): {e!r}")
+            api_version = None
+
+        elapsed = time.monotonic() - started
+        if not api_version:
+            logger.warning(f"{name} is unreachable after {elapsed:.2f}s, degraded")
+            if (
+                self.degraded
+                and self.breaker
+                and self.breaker.state == BreakerState.CLOSED
+            ):
+                # Fail fast until the breaker lets the next request probe
+                self.breaker.trip()
+            return False
+
+        logger.info(f"Started {name} (version {api_version}) in {elapsed:.2f}s")
+        self.check_reference_data()
+        return True
+
+    async def _retry_start(self):
+        delay = STARTUP_RETRY_BASE
+        while True:
+            await asyncio.sleep(delay)
+            if await self.start():
+                return
+            delay = min(delay * 2, STARTUP_RETRY_CAP)
+
+    def retry_start(self):
+        if self.starting and not self.starting.done():
+            return
+        self.starting = asyncio.get_running_loop().create_task(self._retry_start())
+
+    def check_available(self):
+        # Never reached so far, only fail fast while the breaker is open. Once
+        # it lets a probe through, the handler's request is that probe.
+        breaker = self.breaker
+        if (
+            self.degraded
+            and breaker
+            and breaker.state == BreakerState.OPEN
+            and breaker.retry_in()
+        ):
+            raise ServiceUnavailableError(self.commands[0], breaker.retry_in())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Warm state of the service, to be restored after a restart"""
+        snapshot = {
+            "api_url": self.api_url,
+            "api_version": self.api_version,
+            "reference": dict(self.reference.items) if self.reference else {},
+            "lookup_cache": self.lookup_cache.dump(),
+            "item_cache": self.item_cache.dump(),
+        }
+        if self.library.built_at:
+            snapshot["library"] = self.library.items
+        return snapshot
+
+    def restore(self, snapshot: Dict[str, Any], age: float):
+        if snapshot.get("api_url") != self.api_url:
+            logger.debug(f"Ignoring snapshot of {self.commands[0]}, api changed")
+            return
+        # Everything restored is revalidated in the background once used
+        self.api_version = snapshot.get("api_version")
+        if self.api_version:
+            # Known to work before, usable while being probed again
+            self.degraded = False
+        if self.reference:
+            self.reference.restore(snapshot.get("reference", {}))
+        self.lookup_cache.load(snapshot.get("lookup_cache", []), age)
+        self.item_cache.load(snapshot.get("item_cache", []), age)
+        if "library" in snapshot:
+            self.library.restore(snapshot["library"])
+
+    def check_reference_data(self):
+        for kind in self.reference.kinds if self.reference else []:
+            if kind != TAG and not self.reference.get_all(kind):
+                logger.warning(
+                    f"No {REFERENCE_NAMES[kind]} configured! Please configure {REFERENCE_NAMES[kind]} inside the {type(self).__name__} interface. Otherwise Butlarr might not behave as expected."
+                )
 
-    def _get(self, endpoint, params={}):
-        return requests.get(
-            f"{self.api_url}/{endpoint}", params={"apikey": self.api_key, **params}
+    @property
+    def root_folders(self):
+        return self.reference.get_all(ROOT_FOLDER) if self.reference else []
+
+    @property
+    def quality_profiles(self):
+        return self.reference.get_all(QUALITY_PROFILE) if self.reference else []
+
+    @property
+    def language_profiles(self):
+        return self.reference.get_all(LANGUAGE_PROFILE) if self.reference else []
+
+    @property
+    def tags(self):
+        return self.reference.get_all(TAG) if self.reference else []
+
+    def static_menu_key(self, state, item, allow_edit=False):
+        """Keyboard cache key of the reference data pickers, None otherwise"""
+        kind = STATIC_MENUS.get(state.menu)
+        if not kind or not self.reference:
+            return None
+        # Also schedules the refresh of stale data, as rendering would
+        self.reference.get_all(kind)
+        in_library = bool("id" in item and item["id"])
+        return (self, state.menu, in_library, bool(allow_edit), self.reference.version)
+
+    async def _arequest(self, action: Action, endpoint: str, params={}):
+        client = get_async_client(self.api_url)
+        url = f"{self.api_url}/{endpoint}"
+        timeout = httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        if action in (Action.GET, Action.DELETE):
+            return await client.request(
+                action.value,
+                url,
+                params={"apikey": self.api_key, **params},
+                timeout=timeout,
+            )
+        return await client.request(
+            action.value,
+            url,
+            params={"apikey": self.api_key},
+            json=params,
+            timeout=timeout,
         )
 
-    def _delete(self, endpoint, params={}):
-        return requests.delete(
-            f"{self.api_url}/{endpoint}", params={"apikey": self.api_key, **params}
-        )
+    async def _aretry(self, action: Action, endpoint: str, send):
+        """Sends a request (retried if idempotent), recording the outcome in the breaker"""
+        if self.breaker:
+            self.breaker.check()
 
-    def request(self, endpoint: str, *, action=Action.GET, params={}, fallback=None):
+        # Only idempotent requests are safe to retry
+        attempts = 1 + (self.retries if action == Action.GET else 0)
         r = None
-        if action == Action.GET:
-            r = self._get(endpoint, params)
-        elif action == Action.POST:
-            r = self._post(endpoint, params)
-        elif action == Action.PUT:
-            r = self._put(endpoint, params)
-        elif action == Action.DELETE:
-            r = self._delete(endpoint, params)
-
-        if not r:
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(retry_backoff(attempt - 1))
+            try:
+                r = await send()
+            except httpx.RequestError as e:
+                logger.warning(
+                    f"Request to {self.api_url}/{endpoint} failed ({attempt + 1}/{attempts}): {e!r}"
+                )
+                r = None
+                continue
+            except asyncio.CancelledError:
+                # Says nothing about the service, but must not keep the probe
+                if self.breaker:
+                    self.breaker.release()
+                raise
+            except BaseException:
+                if self.breaker:
+                    self.breaker.record_failure()
+                raise
+            # Server errors are worth another try, client errors are not
+            if r.status_code < 500:
+                break
+
+        if self.breaker:
+            if r is None or r.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return r
+
+    async def arequest(
+        self, endpoint: str, *, action=Action.GET, params={}, fallback=None
+    ):
+        r = await self._aretry(
+            action, endpoint, lambda: self._arequest(action, endpoint, params)
+        )
+        if r is None or not r.is_success:
             return fallback
 
         if action != Action.DELETE:
             return r.json()
         return r
 
-    def detect_api(self, api_host):
-        status = None
-        # Detect version and api_url
-        try:
-            self.api_url = f"{api_host.rstrip('/')}/api/v3"
-            status = self.request("system/status")
-            if not status:
-                self.api_url = f"{api_host.rstrip('/')}/api"
-                status = self.request("system/status")
-                assert not status, "By default only v3 ArrServices are supported"
-        finally:
-            if status is None:
-                logger.error(
-                    f"Could not reach compatible api. Is the service ({self.api_url}) down? Is your API key correct?"
-                )
-                exit(1)
-            assert (
-                status
-            ), "Could not reach compatible api. Is the service down? Is your API key correct?"
-            api_version = status.get("version", "")
-            assert api_version, "Could not find compatible api."
-            return api_version
-
-    def get_queue_item(self, id: int):
-        return self.request(
+    async def arequest_records(
+        self, endpoint: str, *, params={}, key=None, fields=None, fallback=None
+    ):
+        """
+        GETs a (possibly huge) list of records, which are decoded while the
+        response arrives, only keeping `fields` of every record. `key` selects
+        the list of an object response, e.g. the records of a queue page.
+        """
+        client = get_async_client(self.api_url)
+        timeout = httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        records = None
+
+        async def send():
+            nonlocal records
+            records = None
+            async with client.stream(
+                "GET",
+                f"{self.api_url}/{endpoint}",
+                params={"apikey": self.api_key, **params},
+                timeout=timeout,
+            ) as r:
+                if not r.is_success:
+                    return r
+                decoder = RecordDecoder(key, fields)
+                received = []
+                try:
+                    async for chunk in r.aiter_bytes():
+                        received += decoder.feed(chunk)
+                    records = received + decoder.close()
+                except (JsonStreamError, UnicodeDecodeError) as e:
+                    # e.g. the HTML page of a misconfigured proxy
+                    logger.error(f"Invalid response of {self.api_url}/{endpoint}: {e}")
+                return r
+
+        r = await self._aretry(Action.GET, endpoint, send)
+        if r is None or not r.is_success or records is None:
+            return fallback
+        return records
+
+    async def adetect_api(self):
+        status = await self.arequest("system/status", fallback=None)
+        if not status:
+            logger.error(
+                f"Could not reach compatible api. Is the service ({self.api_url}) down? Is your API key correct?"
+            )
+            return None
+        return status.get("version") or None
+
+    async def aget_queue_item(self, id: int):
+        return await self.arequest(
             f"queue/{id}",
-            params=params,
             fallback=[],
         )
 
-    def get_queue(self, page: int = None, page_size: int = None):
+    def _queue_params(self, page: int = None, page_size: int = None):
         params = {}
         if page != None:
             params["page"] = page
         if page_size != None:
             params["page_size"] = page_size
-        return self.request(
+        return params
+
+    async def aget_queue(self, page: int = None, page_size: int = None):
+        return await self.arequest(
             "queue",
-            params=params,
+            params=self._queue_params(page, page_size),
             fallback=[],
         )
 
-    def get_queue_details(self, movie_id: int = None, include_movie: bool = None):
+    async def aget_queue_records(self, limit: int):
+        """First `limit` queue records in one request, None if unavailable"""
+        return await self.arequest_records(
+            "queue",
+            params={"page": 1, "pageSize": limit},
+            key="records",
+            fields=QUEUE_RECORD_FIELDS,
+            fallback=None,
+        )
+
+    def _queue_details_params(self, movie_id: int = None, include_movie: bool = None):
         params = {}
         if movie_id:
             params["movieId"] = movie_id
         if include_movie != None:
             params["includeMovie"] = include_movie
-        return self.request(
+        return params
+
+    async def aget_queue_details(
+        self, movie_id: int = None, include_movie: bool = None
+    ):
+        return await self.arequest(
             "queue",
-            params=params,
+            params=self._queue_details_params(movie_id, include_movie),
             fallback=[],
         )
 
-    def get_queue_detail(self, id: int):
-        return self.request(
+    async def aget_queue_detail(self, id: int):
+        return await self.arequest(
             f"queue/details/{id}",
             params={},
             fallback=[],
         )
 
-    def list_(self):
+    async def alist_(self):
         if not self.arr_variant:
             return NotImplementedError(
                 "Unsupported Arr variant. You have to implement your own search"
             )
 
-        return self.request(f"{self.arr_variant.value}", fallback=[])
+        return await self.arequest(f"{self.arr_variant.value}", fallback=[])
 
-    def lookup(self, term: str = None):
+    async def alist_records(self, fields=None):
+        """Streams the library, only keeping `fields` of every item"""
+        if not self.arr_variant:
+            return NotImplementedError(
+                "Unsupported Arr variant. You have to implement your own search"
+            )
+
+        return await self.arequest_records(
+            f"{self.arr_variant.value}", fields=fields, fallback=None
+        )
+
+    @cached_property
+    def lookup_cache(self) -> AsyncTTLCache:
+        return AsyncTTLCache(
+            max_entries=LOOKUP_CACHE_SIZE,
+            ttl=LOOKUP_CACHE_TTL,
+            negative_ttl=LOOKUP_CACHE_NEGATIVE_TTL,
+        )
+
+    @cached_property
+    def item_cache(self) -> TTLCache:
+        return TTLCache(max_entries=ITEM_CACHE_SIZE, ttl=ITEM_CACHE_TTL)
+
+    def item_key(self, item) -> str:
+        id_fields = ["tvdbId", "tmdbId", "imdbId"]
+        if self.arr_variant == ArrVariant.RADARR:
+            id_fields = ["tmdbId", "imdbId"]
+        for field in id_fields:
+            if item.get(field):
+                return f"{field[:4]}:{item[field]}"
+        if item.get("id"):
+            return f"id:{item['id']}"
+        return f"title:{normalize_term(item.get('title', ''))}"
+
+    def remember_items(self, items) -> List[ItemRef]:
+        refs = []
+        for item in items:
+            ref = ItemRef(
+                key=self.item_key(item),
+                title=item.get("title", ""),
+                year=item.get("year"),
+                id=item.get("id"),
+            )
+            self.item_cache.set(ref.key, item)
+            refs.append(ref)
+        return refs
+
+    async def resolve_item(self, ref: ItemRef):
+        item = self.item_cache.get(ref.key)
+        if item is not MISSING:
+            return item
+
+        # Evicted from the cache, fetch it again
+        item = None
+        if ref.key in self.library.by_id:
+            item = self.library.items[self.library.by_id[ref.key]]
+        elif ref.id:
+            item = await self.arequest(f"{self.arr_variant.value}/{ref.id}")
+        elif not ref.key.startswith("title:"):
+            items = await self.alookup(ref.key)
+            item = next((i for i in items if self.item_key(i) == ref.key), None)
+        if not item:
+            # Only the very same item, not just another one of that title
+            items = await self.alookup(ref.title)
+            item = next((i for i in items if self.item_key(i) == ref.key), None)
+        if item:
+            self.item_cache.set(ref.key, item)
+        return item
+
+    @staticmethod
+    def poster_url(item) -> Optional[str]:
+        url = item.get("remotePoster")
+        if not url and item.get("images"):
+            url = item["images"][0].get("remoteUrl")
+        return url
+
+    async def prefetch_item(self, ref: ItemRef):
+        item = await self.resolve_item(ref)
+        if item and (url := self.poster_url(item)):
+            await prefetch_poster(get_async_client(url), url)
+
+    def prefetch_neighbours(self, key, state):
+        """Warms the items around the current one in the background, next first"""
+        neighbours = [state.index + 1, state.index - 1] if state else []
+        refs = [state.items[idx] for idx in neighbours if 0 <= idx < len(state.items)]
+        jobs = [partial(self.prefetch_item, ref) for ref in refs]
+        if state and state.lookup:
+            # Results beyond the library matches, cached for merge_lookup
+            jobs.append(partial(self.alookup, state.lookup))
+        prefetcher.schedule(key, jobs)
+
+    def cancel_prefetch(self, key):
+        prefetcher.cancel(key)
+
+    async def current_item(self, state):
+        if not state or not state.items:
+            return None
+        return await self.resolve_item(state.items[state.index])
+
+    @cached_property
+    def library(self) -> LibraryIndex:
+        return LibraryIndex(self)
+
+    async def list_window(
+        self, query: str = "", sort: str = SORT_TITLE, position: int = 0, letter=None
+    ):
+        """
+        Loads the window of a library listing around a position (or the first
+        item of a letter). Returns the window items, the listing and the
+        index of the position within the window.
+        """
+        await self.library.ensure()
+        view = self.library.view(query, sort)
+        if letter:
+            position = self.library.letter_position(view, letter)
+        position = max(0, min(position, len(view) - 1))
+        offset = max(
+            0, min(position - LIST_WINDOW_SIZE // 2, len(view) - LIST_WINDOW_SIZE)
+        )
+        items = [
+            self.library.items[idx] for idx in view[offset : offset + LIST_WINDOW_SIZE]
+        ]
+        listing = Listing(query=query, sort=sort, offset=offset, total=len(view))
+        return items, listing, position - offset
+
+    async def seek(self, state, position: int = None, sort: str = None, letter=None):
+        """Moves a session to another item, loading another window if needed"""
+        listing = state.listing
+        if not listing:
+            if position is None:
+                return state
+            if state.lookup and position >= len(state.items):
+                state = await self.merge_lookup(state)
+            return replace(state, index=min(position, len(state.items) - 1))
+        window = range(listing.offset, listing.offset + len(state.items))
+        if position in window and not sort and not letter:
+            return replace(state, index=position - listing.offset)
+
+        items, listing, index = await self.list_window(
+            listing.query, sort or listing.sort, position or 0, letter
+        )
+        return replace(
+            state, items=self.remember_items(items), index=index, listing=listing
+        )
+
+    def listing_rows(self, state) -> List[List[Button]]:
+        """Jump controls of library listings"""
+        if not state.listing:
+            return []
+        position, total = self.list_position(state)
+        next_sort = SORTS[(SORTS.index(state.listing.sort) + 1) % len(SORTS)]
+        return [
+            [
+                (
+                    Button(
+                        f"⏪ {LIST_JUMP_SIZE}",
+                        self.get_clbk("goto", max(0, position - LIST_JUMP_SIZE)),
+                    )
+                    if position > 0
+                    else Button()
+                ),
+                Button("🔤 A-Z", self.get_clbk("letters")),
+                Button(f"↕ By {next_sort}", self.get_clbk("sort", next_sort)),
+                (
+                    Button(
+                        f"{LIST_JUMP_SIZE} ⏩",
+                        self.get_clbk(
+                            "goto", min(total - 1, position + LIST_JUMP_SIZE)
+                        ),
+                    )
+                    if position < total - 1
+                    else Button()
+                ),
+            ]
+        ]
+
+    def letter_rows(self) -> List[List[Button]]:
+        return [
+            [Button(l, self.get_clbk("letter", l)) for l in LETTERS[i : i + 7]]
+            for i in range(0, len(LETTERS), 7)
+        ]
+
+    def list_position(self, state) -> Tuple[int, int]:
+        """Position of the current item and total items of the session"""
+        if state.listing:
+            return state.listing.offset + state.index, state.listing.total
+        # A pending lookup might add more items
+        return state.index, len(state.items) + bool(state.lookup)
+
+    async def alookup(self, term: str = None):
         if not self.arr_variant:
             return NotImplementedError(
                 "Unsupported Arr variant. You have to implement your own search"
@@ -162,13 +726,39 @@ class ArrService(TelegramHandler):
         if not term:
             return []
 
-        return self.request(
-            f"{self.arr_variant.value}/lookup",
-            params={"term": term},
-            fallback=[],
+        async def fetch():
+            # Failed requests return None and are therefore not cached
+            return await self.arequest(
+                f"{self.arr_variant.value}/lookup",
+                params={"term": term},
+                fallback=None,
+            )
+
+        items = await self.lookup_cache.get_or_fetch(normalize_term(term), fetch)
+        return items or []
+
+    async def asearch(self, term: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Library titles matching the term are answered right away, the lookup
+        (e.g. for a remake of a movie in the library) is then returned as
+        pending term, fetched in the background and merged once paged to.
+        """
+        self.library.warm()
+        local = self.library.find(term)
+        if local:
+            return local, term
+        return await self.alookup(term), None
+
+    async def merge_lookup(self, state):
+        """Appends the pending lookup results not yet among the session items"""
+        remote = await self.alookup(state.lookup)
+        keys = {ref.key for ref in state.items}
+        new = [item for item in remote if self.item_key(item) not in keys]
+        return replace(
+            state, items=[*state.items, *self.remember_items(new)], lookup=None
         )
 
-    def add(
+    def _add_request(
         self,
         *,
         item=None,
@@ -190,53 +780,106 @@ class ArrService(TelegramHandler):
             action = Action.POST
             endpoint = self.arr_variant.value
 
-        return self.request(
-            endpoint,
-            action=action,
-            params={
-                **item,
-                "qualityProfileId": quality_profile_id,
-                "languageProfileId": language_profile_id,
-                "rootFolderPath": root_folder_path,
-                "tags": tags,
-                "monitored": monitored,
-                "minimumAvailability": min_availability,
-                **options,
-            },
-        )
+        params = {
+            **item,
+            "qualityProfileId": quality_profile_id,
+            "languageProfileId": language_profile_id,
+            "rootFolderPath": root_folder_path,
+            "tags": tags,
+            "monitored": monitored,
+            "minimumAvailability": min_availability,
+            **options,
+        }
+        return endpoint, action, params
+
+    async def aadd(self, **kwargs):
+        item = kwargs.get("item")
+        if item and item.get("id"):
+            # Library index items only keep some fields, updates need all of them
+            full_item = await self.arequest(
+                f"{self.arr_variant.value}/{item['id']}", fallback=None
+            )
+            kwargs["item"] = full_item or item
+        endpoint, action, params = self._add_request(**kwargs)
+        result = await self.arequest(endpoint, action=action, params=params)
+        # Cached lookups still show the previous library status
+        self.lookup_cache.invalidate()
+        self.library.invalidate()
+        return result
+
+    def import_options(self) -> Dict[str, Any]:
+        """Add options of bulk imports, the first profiles and root folder"""
+        raise NotImplementedError
+
+    async def aimport(self, items: List[Dict[str, Any]], **kwargs):
+        """
+        Adds many new items at once through the bulk import endpoint, or one
+        by one on Arr versions without it. Returns the added items.
+        """
+        added = []
+        slots = asyncio.Semaphore(IMPORT_ADD_CONCURRENCY)
+
+        async def add(params):
+            async with slots:
+                return await self.arequest(
+                    self.arr_variant.value, action=Action.POST, params=params
+                )
 
-    def remove(self, *, id=None):
+        for start in range(0, len(items), IMPORT_BATCH_SIZE):
+            batch = items[start : start + IMPORT_BATCH_SIZE]
+            params = [self._add_request(item=i, **kwargs)[2] for i in batch]
+            result = await self.arequest(
+                f"{self.arr_variant.value}/import", action=Action.POST, params=params
+            )
+            if result is not None:
+                added += batch
+                continue
+            logger.debug(f"Bulk import of {self.commands[0]} failed, adding one by one")
+            results = await asyncio.gather(*[add(p) for p in params])
+            added += [item for item, r in zip(batch, results) if r]
+
+        self.lookup_cache.invalidate()
+        self.library.invalidate()
+        return added
+
+    async def aremove(self, *, id=None):
         assert id, "Missing required arg! You need to provide a id!"
-        return self.request(
+        result = await self.arequest(
             f"{self.arr_variant.value}/{id}",
             action=Action.DELETE,
         )
+        self.lookup_cache.invalidate()
+        self.library.invalidate()
+        return result
 
-    def get_root_folders(self) -> List[str]:
-        return self.request("rootfolder", fallback=[])
+    async def aget_root_folders(self) -> List[str]:
+        return await self.arequest("rootfolder", fallback=[])
 
-    def get_root_folder(self, id: str) -> List[str]:
-        return self.request(f"rootfolder/{id}", fallback={})
+    async def aget_root_folder(self, id: str) -> List[str]:
+        return await self.arequest(f"rootfolder/{id}", fallback={})
 
-    def get_tags(self):
-        return self.request("tag", fallback=[])
+    async def aget_tags(self):
+        return await self.arequest("tag", fallback=[])
 
-    def get_tag(self, id: str):
-        return self.request(f"tag/{id}", fallback={})
+    async def aget_tag(self, id: str):
+        return await self.arequest(f"tag/{id}", fallback={})
 
-    def add_tag(self, label):
-        return self.request(
+    async def aadd_tag(self, label):
+        tag = await self.arequest(
             "tag", action=Action.POST, params={"label": label}, fallback={}
         )
+        if self.reference:
+            self.reference.invalidate(TAG)
+        return tag
 
-    def get_quality_profiles(self):
-        return self.request("qualityprofile", fallback=[])
+    async def aget_quality_profiles(self):
+        return await self.arequest("qualityprofile", fallback=[])
 
-    def get_quality_profile(self, id):
-        return self.request(f"qualityprofile/{id}", fallback={})
+    async def aget_quality_profile(self, id):
+        return await self.arequest(f"qualityprofile/{id}", fallback={})
 
-    def get_language_profiles(self):
-        return self.request("languageprofile", fallback=[])
+    async def aget_language_profiles(self):
+        return await self.arequest("languageprofile", fallback=[])
 
-    def get_language_profile(self, id):
-        return self.request(f"languageprofile/{id}", fallback={})
+    async def aget_language_profile(self, id):
+        return await self.arequest(f"languageprofile/{id}", fallback={})
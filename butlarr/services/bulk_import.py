@@ -0,0 +1,294 @@
+import asyncio
+import csv
+import re
+import time
+
+from dataclasses import dataclass, field
+from loguru import logger
+from telegram.error import BadRequest, TelegramError
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..cache import normalize_term
+from ..tg_handler.message import no_edit_error_messages
+
+# Lookups running at once per import
+IMPORT_CONCURRENCY = 4
+IMPORT_MAX_ENTRIES = 1000
+IMPORT_MAX_BYTES = 1024 * 1024
+# Seconds between edits of the progress message
+PROGRESS_INTERVAL = 2.0
+# Telegram rejects longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+IMDB_ID_REGEX = re.compile(r"^(?:imdb:\s*)?(tt\d+)$", re.IGNORECASE)
+PREFIXED_ID_REGEX = re.compile(r"^(tmdb|tvdb):\s*(\d+)$", re.IGNORECASE)
+TITLE_YEAR_REGEX = re.compile(r"^(.*?)[\s,;]*[(\[]?((?:19|20)\d\d)[)\]]?$")
+IMPORT_COMMAND_REGEX = re.compile(r"^/\S+\s+import\b", re.IGNORECASE)
+
+# CSV columns (lower case) holding ids, e.g. "Const" of IMDb list exports
+ID_COLUMNS = {
+    "imdb": "imdb",
+    "imdbid": "imdb",
+    "imdb_id": "imdb",
+    "const": "imdb",
+    "tmdb": "tmdb",
+    "tmdbid": "tmdb",
+    "tmdb_id": "tmdb",
+    "tvdb": "tvdb",
+    "tvdbid": "tvdb",
+    "tvdb_id": "tvdb",
+}
+TITLE_COLUMNS = ["title", "name", "original title"]
+YEAR_COLUMNS = ["year"]
+
+
+@dataclass(frozen=True)
+class ImportEntry:
+    line: int
+    # As given, for the summary
+    text: str
+    term: str
+    year: Optional[int] = None
+    by_id: bool = False
+
+
+def parse_entry(text: str, line: int, year=None) -> Optional[ImportEntry]:
+    text = text.strip().strip('"').strip()
+    if not text or text.startswith("#"):
+        return None
+    if match := IMDB_ID_REGEX.match(text):
+        return ImportEntry(line, text, f"imdb:{match.group(1).lower()}", by_id=True)
+    if match := PREFIXED_ID_REGEX.match(text):
+        term = f"{match.group(1).lower()}:{match.group(2)}"
+        return ImportEntry(line, text, term, by_id=True)
+    if not year and (match := TITLE_YEAR_REGEX.match(text)) and match.group(1):
+        return ImportEntry(line, text, match.group(1), year=int(match.group(2)))
+    return ImportEntry(line, text, text, year=int(year) if year else None)
+
+
+def iter_text_entries(lines: Iterable[str], first_line: int = 1):
+    for number, text in enumerate(lines, first_line):
+        if entry := parse_entry(text, number):
+            yield entry
+
+
+def _csv_columns(lines: List[str]):
+    """Dialect and the id, title and year columns named by the header row"""
+    try:
+        dialect = csv.Sniffer().sniff(lines[0] if lines else "", ",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    header = [c.strip().lower() for c in next(csv.reader(lines[:1], dialect), [])]
+    id_columns = [(i, ID_COLUMNS[c]) for i, c in enumerate(header) if c in ID_COLUMNS]
+    title_column = next((header.index(c) for c in TITLE_COLUMNS if c in header), None)
+    year_column = next((header.index(c) for c in YEAR_COLUMNS if c in header), None)
+    return dialect, id_columns, title_column, year_column
+
+
+def iter_csv_entries(lines: List[str]) -> Iterator[ImportEntry]:
+    """Rows of a CSV file, by their id or title column if there is a header"""
+    dialect, id_columns, title_column, year_column = _csv_columns(lines)
+    rows = csv.reader(lines, dialect)
+    if not id_columns and title_column is None:
+        # No header, the first column is the title or id
+        yield from iter_text_entries(row[0] if row else "" for row in rows)
+        return
+
+    next(rows, None)
+    for number, row in enumerate(rows, 2):
+        cell = lambda idx: (
+            row[idx].strip() if idx is not None and idx < len(row) else ""
+        )
+        entry = None
+        for idx, kind in id_columns:
+            if value := cell(idx):
+                value = value if kind == "imdb" else f"{kind}:{value}"
+                if entry := parse_entry(value, number):
+                    break
+        if not entry and (title := cell(title_column)):
+            year = cell(year_column)
+            entry = parse_entry(title, number, year if year.isdigit() else None)
+        if entry:
+            yield entry
+
+
+def import_entries(text: str, filename: str = "") -> Tuple[Iterator[ImportEntry], int]:
+    """Lazily parsed entries of a pasted list or uploaded file, and their count"""
+    lines = text.splitlines()[:IMPORT_MAX_ENTRIES]
+    if IMPORT_COMMAND_REGEX.match(lines[0] if lines else ""):
+        # Pasted below (or next to) the command itself
+        lines[0] = IMPORT_COMMAND_REGEX.sub("", lines[0])
+    total = sum(1 for l in lines if l.strip() and not l.strip().startswith("#"))
+    if filename.lower().endswith(".csv"):
+        _, id_columns, title_column, _ = _csv_columns(lines)
+        has_header = bool(id_columns) or title_column is not None
+        return iter_csv_entries(lines), max(0, total - has_header)
+    return iter_text_entries(lines), total
+
+
+@dataclass
+class ImportResult:
+    added: List[Dict[str, Any]] = field(default_factory=list)
+    existing: List[ImportEntry] = field(default_factory=list)
+    missing: List[ImportEntry] = field(default_factory=list)
+    ambiguous: List[Tuple[ImportEntry, List[Dict[str, Any]]]] = field(
+        default_factory=list
+    )
+    failed: List[Dict[str, Any]] = field(default_factory=list)
+    resolved: int = 0
+
+
+class BulkImport:
+    """
+    Resolves a list of titles and ids with a few concurrent lookups, then
+    adds the unambiguous matches with the default profiles and root folder.
+    A progress message is kept up to date while importing.
+    """
+
+    service: Any
+
+    def __init__(self, service, entries: Iterator[ImportEntry], total: int):
+        self.service = service
+        self.entries = entries
+        self.total = total
+        self.result = ImportResult()
+        # Queued for adding, by item key to skip duplicates
+        self.matches: Dict[str, Dict[str, Any]] = {}
+        self.stage = "Looking up"
+
+    async def _resolve(self, entry: ImportEntry):
+        items = await self.service.alookup(entry.term)
+        candidates = items[:1] if entry.by_id else self._candidates(entry, items)
+        if entry.year and not candidates and not entry.by_id:
+            # The year might be part of the title (e.g. "Blade Runner 2049")
+            items = await self.service.alookup(entry.text)
+            candidates = self._candidates(
+                ImportEntry(entry.line, entry.text, entry.text), items
+            )
+
+        if not candidates:
+            self.result.missing.append(entry)
+        elif len(candidates) > 1:
+            self.result.ambiguous.append((entry, candidates[:3]))
+        elif candidates[0].get("id"):
+            self.result.existing.append(entry)
+        else:
+            self.matches.setdefault(self.service.item_key(candidates[0]), candidates[0])
+        self.result.resolved += 1
+
+    @staticmethod
+    def _candidates(entry: ImportEntry, items: List[Dict[str, Any]]):
+        if entry.year:
+            items = [i for i in items if i.get("year") == entry.year]
+        title = normalize_term(entry.term)
+        exact = [i for i in items if normalize_term(i.get("title", "")) == title]
+        # A single exact title match wins over similar titles
+        return exact or items
+
+    async def _worker(self, queue: asyncio.Queue):
+        while (entry := await queue.get()) is not None:
+            try:
+                await self._resolve(entry)
+            except Exception as e:
+                logger.warning(f"Could not resolve import entry {entry}: {e!r}")
+                self.result.missing.append(entry)
+                self.result.resolved += 1
+
+    async def resolve(self):
+        # Entries are parsed while the first lookups are already running
+        queue = asyncio.Queue(maxsize=IMPORT_CONCURRENCY * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue)) for _ in range(IMPORT_CONCURRENCY)
+        ]
+        try:
+            for entry in self.entries:
+                await queue.put(entry)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def add(self):
+        self.stage = "Adding"
+        items = list(self.matches.values())
+        added = await self.service.aimport(items, **self.service.import_options())
+        added_keys = {self.service.item_key(i) for i in added}
+        self.result.added = added
+        self.result.failed = [
+            i for i in items if self.service.item_key(i) not in added_keys
+        ]
+
+    def progress(self) -> str:
+        return (
+            f"{self.stage}... {self.result.resolved}/{self.total} looked up, "
+            f"{len(self.matches)} to add"
+        )
+
+    def summary(self) -> str:
+        r = self.result
+        lines = [
+            f"Import finished: {len(r.added)} added, {len(r.existing)} already in the library, "
+            f"{len(r.missing)} not found, {len(r.ambiguous)} ambiguous"
+            + (f", {len(r.failed)} failed." if r.failed else ".")
+        ]
+        if r.ambiguous:
+            lines += ["", "Ambiguous, add these by id:"]
+            for entry, items in sorted(r.ambiguous, key=lambda a: a[0].line):
+                options = ", ".join(
+                    f"{i.get('title')} ({i.get('year')}) {self.service.item_key(i)}"
+                    for i in items
+                )
+                lines.append(f"- line {entry.line}: {entry.text} -> {options}")
+        if r.missing:
+            lines += ["", "Not found:"]
+            lines += [
+                f"- line {e.line}: {e.text}"
+                for e in sorted(r.missing, key=lambda e: e.line)
+            ]
+        if r.failed:
+            lines += ["", "Could not be added:"]
+            lines += [f"- {i.get('title')} ({i.get('year')})" for i in r.failed]
+
+        text = ""
+        for idx, line in enumerate(lines):
+            more = f"\n... and {len(lines) - idx} more lines"
+            if len(text) + len(line) + 1 + len(more) > MAX_MESSAGE_LENGTH:
+                return text + more
+            text += ("\n" if text else "") + line
+        return text
+
+    async def run(self, bot, chat_id: int, message_id: int) -> ImportResult:
+        started = time.monotonic()
+
+        async def edit(text):
+            try:
+                await bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id
+                )
+            except BadRequest as e:
+                if e.message not in no_edit_error_messages:
+                    logger.debug(f"Could not update import progress: {e}")
+            except TelegramError as e:
+                logger.warning(f"Could not update import progress: {e}")
+
+        async def report():
+            shown = None
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                if (progress := self.progress()) != shown:
+                    shown = progress
+                    await edit(progress)
+
+        reporter = asyncio.create_task(report())
+        try:
+            await self.resolve()
+            await self.add()
+        finally:
+            reporter.cancel()
+        logger.info(
+            f"Imported {len(self.result.added)} of {self.total} entries into {self.service.commands[0]} in {time.monotonic() - started:.2f}s"
+        )
+        await edit(self.summary())
+        return self.result
@@ -1,8 +1,11 @@
 import math
 from typing import Dict, Any
 from dataclasses import dataclass
+from functools import cached_property
 
 from . import ArrService
+from .bulk_import import BulkImport, IMPORT_MAX_BYTES, import_entries
+from .live_queue import LiveQueue
 from ..config.queue import WIDTH, PAGE_SIZE
 
 from ..tg_handler import command, callback, handler, escape_markdownv2_chars
@@ -14,49 +17,72 @@ from ..tg_handler.session_state import sessionState, default_session_state_key_f
 from ..tg_handler.keyboard import Button, keyboard
 
 
+def queue_progress(item: Dict[str, Any]) -> float:
+    return 1.0 - (float(item.get("sizeleft", 0)) / (item.get("size") or 1))
+
+
+def create_queue_item_lines(number: int, item: Dict[str, Any], source: str = None):
+    percent = queue_progress(item)
+    progress = math.floor(percent * WIDTH)
+    remaining = math.ceil((1.0 - percent) * WIDTH)
+
+    title = escape_markdownv2_chars(item.get("title", "")[0 : 2 * WIDTH])
+    source = rf"\[{escape_markdownv2_chars(source)}\] " if source else ""
+    title_ln = rf"{number}\. {source}*{title}*"
+    progress_ln = rf">`[{progress * '='}|{(remaining*' ')}]` {round(percent*100)}%"
+    status_ln = rf">Status: _{escape_markdownv2_chars(item.get('status', 'N/A'))}_ \(_{escape_markdownv2_chars(item.get('trackedDownloadState', '-'))}_\)   Time left: _{escape_markdownv2_chars(item.get('timeleft', 'N/A'))}_"
+
+    return [title_ln, progress_ln, status_ln]
+
+
 @dataclass(frozen=True)
 class QueueState:
     items: Dict[str, Any]
     page: int
     page_size: int
+    live: bool = False
 
 
 @handler
 class ExtArrService(ArrService):
+    @cached_property
+    def live_queue(self) -> LiveQueue:
+        return LiveQueue(self)
+
     @keyboard
     def create_queue_keyboard(self, state: QueueState):
         total_pages = int(state.items["totalRecords"]) // state.page_size
+        # Paging keeps live updates running
+        mode = ["live"] if state.live else []
         return [
             [
                 (
-                    Button("Prev page", self.get_clbk("queue", state.page - 1))
+                    Button("Prev page", self.get_clbk("queue", state.page - 1, *mode))
                     if state.page > 0
                     else Button()
                 ),
                 (
-                    Button("Next page", self.get_clbk("queue", state.page + 1))
+                    Button("Next page", self.get_clbk("queue", state.page + 1, *mode))
                     if state.page < total_pages
                     else Button()
                 ),
             ],
+            (
+                [Button("Stop live updates", self.get_clbk("queue", state.page))]
+                if state.live
+                else (
+                    [Button("Live updates", self.get_clbk("queue", state.page, "live"))]
+                    if int(state.items["totalRecords"])
+                    else []
+                )
+            ),
         ]
 
     def create_queue_message(self, state: QueueState, full_redraw=False):
-        lines = ["*Queue*", ""]
+        lines = ["*Queue* _\\(live\\)_" if state.live else "*Queue*", ""]
         offset = state.page * state.page_size + 1
         for idx, item in enumerate(state.items["records"]):
-            percent = 1.0 - (float(item.get("sizeleft", 0)) / (item.get("size") or 1))
-            progress = math.floor(percent * WIDTH)
-            remaining = math.ceil((1.0 - percent) * WIDTH)
-
-            title = escape_markdownv2_chars(item.get("title", "")[0 : 2 * WIDTH])
-            title_ln = rf"{offset + idx}\. *{title}*"
-            progress_ln = (
-                rf">`[{progress * '='}|{(remaining*' ')}]` {round(percent*100)}%"
-            )
-            status_ln = rf">Status: _{escape_markdownv2_chars(item.get('status', 'N/A'))}_ \(_{escape_markdownv2_chars(item.get('trackedDownloadState', '-'))}_\)   Time left: _{escape_markdownv2_chars(item.get('timeleft', 'N/A'))}_"
-
-            lines += [title_ln, progress_ln, status_ln]
+            lines += create_queue_item_lines(offset + idx, item)
 
         if not len(state.items["records"]):
             n = PAGE_SIZE // 4
@@ -78,7 +104,7 @@ class ExtArrService(ArrService):
         )
 
     async def cmd_queue(self, update, context, args):
-        items = self.get_queue(page=0, page_size=PAGE_SIZE)
+        items = await self.aget_queue(page=0, page_size=PAGE_SIZE)
 
         state = QueueState(
             items=items,
@@ -89,15 +115,38 @@ class ExtArrService(ArrService):
         return self.create_queue_message(state)
 
     async def clbk_queue(self, update, context, args):
-        items = self.get_queue(page=int(args[1]), page_size=PAGE_SIZE)
+        items = await self.aget_queue(page=int(args[1]), page_size=PAGE_SIZE)
 
         state = QueueState(
             items=items,
             page=int(args[1]),
             page_size=PAGE_SIZE,
+            live=len(args) > 2 and args[2] == "live" and bool(items["totalRecords"]),
         )
+        message = self.create_queue_message(state)
 
-        return self.create_queue_message(state)
+        chat_id = update.callback_query.message.chat.id
+        message_id = update.callback_query.message.message_id
+        if state.live:
+            self.live_queue.watch(
+                context.bot, chat_id, message_id, state, message.caption
+            )
+        else:
+            self.live_queue.unwatch(chat_id, message_id)
+        return message
+
+    async def cmd_refresh(self, update, context, args):
+        await self.reference.refresh()
+        return Response(caption="Root folders, profiles and tags reloaded.")
+
+    async def cmd_stats(self, update, context, args):
+        stats = self.lookup_cache.stats()
+        lines = [f"Lookup cache of {self.commands[0]}:"]
+        lines += [
+            f"  {k}: {round(v, 3) if isinstance(v, float) else v}"
+            for k, v in stats.items()
+        ]
+        return Response(caption="\n".join(lines))
 
     async def cmd_help(self, update, context, args):
         response_message = f"""
@@ -112,3 +161,32 @@ Following commands are available:
             response_message += f"\n - `/{self.commands[0]} {cmd} {escape_markdownv2_chars(pattern)}` \t _{escape_markdownv2_chars(desc)}_"
 
         return await update.message.reply_text(response_message, parse_mode="Markdown")
+
+    async def cmd_import(self, update, context, args):
+        message = update.message
+        filename = ""
+        if message.document:
+            document = message.document
+            if (document.file_size or 0) > IMPORT_MAX_BYTES:
+                await message.reply_text(
+                    f"The file is too large, at most {IMPORT_MAX_BYTES // 1024}KB are supported."
+                )
+                return
+            data = await (await document.get_file()).download_as_bytearray()
+            text = data.decode("utf-8-sig", errors="replace")
+            filename = document.file_name or ""
+        else:
+            text = message.text
+
+        entries, total = import_entries(text, filename)
+        if not total:
+            await message.reply_text(
+                f"Send the titles or ids (tt..., tmdb:..., tvdb:...) to import one per line below /{self.commands[0]} import, "
+                f"or upload a .txt or .csv file with /{self.commands[0]} import as caption."
+            )
+            return
+
+        progress = await message.reply_text(f"Importing {total} entries...")
+        await BulkImport(self, entries, total).run(
+            context.bot, progress.chat_id, progress.message_id
+        )
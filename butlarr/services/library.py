@@ -0,0 +1,298 @@
+import asyncio
+import re
+import time
+
+from collections import defaultdict
+from loguru import logger
+from typing import Any, Dict, List, Optional, Set
+
+from ..cache import normalize_term
+from ..circuit_breaker import ServiceUnavailableError
+
+DEFAULT_TTL = 10 * 60
+# Minimum trigram similarity for a fuzzy match
+MIN_SIMILARITY = 0.4
+# Similarity from which a match is considered to be the searched title
+CONFIDENT_SIMILARITY = 0.9
+
+YEAR_REGEX = re.compile(r"\b(19\d\d|20\d\d)\b")
+ID_QUERY_REGEX = re.compile(r"^(tmdb|tvdb|imdb):(\S+)$")
+IMDB_ID_REGEX = re.compile(r"^tt\d+$")
+
+SORT_TITLE = "title"
+SORT_ADDED = "added"
+SORT_YEAR = "year"
+SORTS = [SORT_TITLE, SORT_ADDED, SORT_YEAR]
+
+# Bucket of titles not starting with a letter
+OTHER_LETTER = "#"
+LETTERS = [OTHER_LETTER, *"ABCDEFGHIJKLMNOPQRSTUVWXYZ"]
+
+# Fields kept of every library item, everything the index and views read
+LIBRARY_FIELDS = [
+    "id",
+    "title",
+    "originalTitle",
+    "sortTitle",
+    "alternateTitles",
+    "year",
+    "added",
+    "status",
+    "overview",
+    "runtime",
+    "images",
+    "remotePoster",
+    "tmdbId",
+    "tvdbId",
+    "imdbId",
+    "path",
+    "folderName",
+    "qualityProfileId",
+    "languageProfileId",
+    "tags",
+    "monitored",
+    "hasFile",
+    "seasonFolder",
+    "seasons",
+]
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _sort_title(item) -> str:
+    return (item.get("sortTitle") or item.get("title") or "").lower()
+
+
+def letter_of(item) -> str:
+    first = _sort_title(item)[:1].upper()
+    return first if "A" <= first <= "Z" else OTHER_LETTER
+
+
+def _titles(item) -> List[str]:
+    titles = [item.get("title"), item.get("originalTitle"), item.get("sortTitle")]
+    titles += [t.get("title") for t in item.get("alternateTitles") or []]
+    normalized = []
+    for t in titles:
+        if t and (n := normalize_term(t)) and n not in normalized:
+            normalized.append(n)
+    return normalized
+
+
+class LibraryIndex:
+    """
+    Searchable in-memory copy of the library of an Arr service.
+    Items can be found by (alternate) title, year and tmdb/tvdb/imdb id.
+    Typos are tolerated through a trigram index over all titles.
+    """
+
+    service: Any
+    ttl: float
+
+    def __init__(self, service, ttl: float = DEFAULT_TTL):
+        self.service = service
+        self.ttl = ttl
+        self.refreshing: Optional[asyncio.Task] = None
+        self.build([])
+        # Not built from actual library data yet
+        self.built_at = 0.0
+
+    def __len__(self):
+        return len(self.items)
+
+    def build(self, items: List[Dict[str, Any]]):
+        self.__dict__.update(self._build(items))
+
+    @staticmethod
+    def _build(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        by_id: Dict[str, int] = {}
+        by_year: Dict[int, List[int]] = defaultdict(list)
+        by_trigram: Dict[str, List[int]] = defaultdict(list)
+        titles: List[List[str]] = []
+
+        for idx, item in enumerate(items):
+            for key in ["tmdbId", "tvdbId", "imdbId"]:
+                if value := item.get(key):
+                    by_id[f"{key[:4]}:{value}".lower()] = idx
+            if year := item.get("year"):
+                by_year[int(year)].append(idx)
+
+            item_titles = _titles(item)
+            titles.append(item_titles)
+            for grams in set().union(*map(trigrams, item_titles)):
+                by_trigram[grams].append(idx)
+
+        # Listing orders as positions into items, newest first for added & year
+        by_title = sorted(range(len(items)), key=lambda i: _sort_title(items[i]))
+        orders = {
+            SORT_TITLE: by_title,
+            SORT_ADDED: sorted(
+                by_title, key=lambda i: items[i].get("added") or "", reverse=True
+            ),
+            SORT_YEAR: sorted(
+                by_title, key=lambda i: items[i].get("year") or 0, reverse=True
+            ),
+        }
+        letters: Dict[str, int] = {}
+        for rank, idx in enumerate(by_title):
+            letters.setdefault(letter_of(items[idx]), rank)
+
+        return {
+            "items": items,
+            "by_id": by_id,
+            "by_year": by_year,
+            "by_trigram": by_trigram,
+            "titles": titles,
+            "title_trigrams": [[trigrams(t) for t in ts] for ts in titles],
+            "orders": orders,
+            "ranks": {
+                sort: {idx: rank for rank, idx in enumerate(order)}
+                for sort, order in orders.items()
+            },
+            "letters": letters,
+            "built_at": time.monotonic(),
+        }
+
+    async def refresh(self):
+        started = time.monotonic()
+        try:
+            items = await self.service.alist_records(LIBRARY_FIELDS)
+        except ServiceUnavailableError as e:
+            items = None
+            logger.warning(e)
+        if not isinstance(items, list):
+            logger.warning(f"Could not refresh library of {self.service.commands[0]}")
+            return
+        # Indexing large libraries takes a while, keep it off the event loop.
+        # The new index is swapped in at once, on the event loop thread.
+        self.__dict__.update(await asyncio.to_thread(self._build, items))
+        logger.debug(
+            f"Indexed {len(items)} library items of {self.service.commands[0]} in {time.monotonic() - started:.2f}s"
+        )
+
+    def restore(self, items: List[Dict[str, Any]]):
+        """Loads a previously saved library, which is refreshed on next use"""
+        self.build(items)
+        self.built_at = time.monotonic() - self.ttl - 1
+
+    def _schedule_refresh(self):
+        if self.refreshing and not self.refreshing.done():
+            return
+        self.refreshing = asyncio.get_running_loop().create_task(self.refresh())
+
+    def invalidate(self):
+        # The current index keeps being served until the rebuild is done
+        self._schedule_refresh()
+
+    def warm(self):
+        """Starts a background (re)build if the index is missing or outdated"""
+        if not self.built_at or time.monotonic() - self.built_at > self.ttl:
+            self._schedule_refresh()
+
+    async def ensure(self):
+        """Builds the index on first use, afterwards refreshes it in the background"""
+        if not self.built_at:
+            self._schedule_refresh()
+            await asyncio.shield(self.refreshing)
+        elif time.monotonic() - self.built_at > self.ttl:
+            self._schedule_refresh()
+
+    def _id_lookup(self, query: str) -> Optional[int]:
+        query = query.replace(" ", "").lower()
+        if IMDB_ID_REGEX.match(query):
+            query = f"imdb:{query}"
+        if ID_QUERY_REGEX.match(query) and query in self.by_id:
+            return self.by_id[query]
+        return None
+
+    def _similarities(self, query: str, candidates: Optional[Set[int]] = None):
+        query_grams = trigrams(query)
+        counts: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for idx in self.by_trigram.get(gram, []):
+                counts[idx] += 1
+
+        # Items sharing too few trigrams can not reach the minimum similarity
+        min_shared = MIN_SIMILARITY * len(query_grams) / 2
+        similarities = {}
+        for idx, shared in counts.items():
+            if shared < min_shared:
+                continue
+            if candidates is not None and idx not in candidates:
+                continue
+            # Dice coefficient against the best matching title of the item
+            best = max(
+                (
+                    (len(query_grams & grams) * 2) / (len(query_grams) + len(grams))
+                    for grams in self.title_trigrams[idx]
+                ),
+                default=0.0,
+            )
+            if best >= MIN_SIMILARITY:
+                similarities[idx] = best
+        return similarities
+
+    def search(
+        self, query: str, limit: Optional[int] = 50, min_similarity=MIN_SIMILARITY
+    ) -> List[Dict[str, Any]]:
+        indices = self._search(query, min_similarity)
+        return [self.items[idx] for idx in indices[:limit]]
+
+    def _search(self, query: str, min_similarity=MIN_SIMILARITY) -> List[int]:
+        """Positions of the matching items, best match first"""
+        if (idx := self._id_lookup(query)) is not None:
+            return [idx]
+
+        year_match = YEAR_REGEX.search(query)
+        year = int(year_match.group(1)) if year_match else None
+        text = normalize_term(YEAR_REGEX.sub(" ", query) if year else query)
+        if not text:
+            # Only a year was given
+            return self.by_year.get(year, [])
+
+        candidates = set(self.by_year.get(year, [])) if year else None
+        similarities = self._similarities(text, candidates)
+        if year and not similarities:
+            # The year might actually be part of the title (e.g. "1917")
+            similarities = self._similarities(normalize_term(query))
+
+        ranked = sorted(
+            (idx for idx, sim in similarities.items() if sim >= min_similarity),
+            key=lambda idx: (-similarities[idx], self.titles[idx][0]),
+        )
+        return ranked
+
+    def find(self, query: str) -> List[Dict[str, Any]]:
+        """Only returns items that are confidently the searched for title"""
+        return self.search(query, limit=None, min_similarity=CONFIDENT_SIMILARITY)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return [self.items[idx] for idx in self.orders[SORT_TITLE]]
+
+    def view(self, query: str = "", sort: str = SORT_TITLE) -> List[int]:
+        """
+        Positions of the items of a listing in display order. Without a query
+        the precomputed order is returned as is, otherwise the matches are
+        ordered by relevance (title sort) or by their precomputed rank.
+        """
+        if not query:
+            return self.orders[sort]
+        indices = self._search(query)
+        if sort != SORT_TITLE:
+            ranks = self.ranks[sort]
+            indices = sorted(indices, key=ranks.__getitem__)
+        return indices
+
+    def letter_position(self, view: List[int], letter: str) -> int:
+        """Position of the first item of a letter, or of the next letter present"""
+        following = LETTERS[LETTERS.index(letter) :]
+        if view is self.orders[SORT_TITLE]:
+            letters = self.letters
+        else:
+            # Filtered or differently sorted views are small enough to scan
+            letters = {}
+            for position, idx in enumerate(view):
+                letters.setdefault(letter_of(self.items[idx]), position)
+        return next((letters[l] for l in following if l in letters), len(view) - 1)
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+from dataclasses import dataclass, replace
+from loguru import logger
+from telegram.error import BadRequest, TelegramError
+from typing import Any, Dict, Optional, Tuple
+
+from ..circuit_breaker import ServiceUnavailableError
+from ..config.queue import LIVE_INTERVAL, LIVE_TIMEOUT, PAGE_SIZE
+from ..tg_handler.message import no_edit_error_messages
+
+WatcherKey = Tuple[int, int]
+
+
+@dataclass
+class Watcher:
+    chat_id: int
+    message_id: int
+    # QueueState the message was last rendered from
+    state: Any
+    last_active: float
+    caption: str = ""
+
+
+class LiveQueue:
+    """
+    Keeps queue messages of an Arr service up to date.
+    A single background job re-fetches every watched page once per interval
+    and only edits the messages whose rendered content changed. Messages
+    stop being watched after `timeout` seconds without interaction, or
+    once the queue is empty.
+    """
+
+    service: Any
+    interval: float
+    timeout: float
+
+    def __init__(
+        self, service, interval: float = LIVE_INTERVAL, timeout: float = LIVE_TIMEOUT
+    ):
+        self.service = service
+        self.interval = interval
+        self.timeout = timeout
+        self.bot = None
+        self.watchers: Dict[WatcherKey, Watcher] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.watchers)
+
+    def is_watched(self, chat_id: int, message_id: int) -> bool:
+        return (chat_id, message_id) in self.watchers
+
+    def watch(self, bot, chat_id: int, message_id: int, state, caption: str):
+        """Starts (or keeps) watching a message, any call counts as activity"""
+        self.bot = bot
+        self.watchers[(chat_id, message_id)] = Watcher(
+            chat_id=chat_id,
+            message_id=message_id,
+            state=state,
+            last_active=time.monotonic(),
+            caption=caption,
+        )
+        if not self.task or self.task.done():
+            logger.debug(f"Starting live queue of {self.service.commands[0]}")
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def unwatch(self, chat_id: int, message_id: int):
+        self.watchers.pop((chat_id, message_id), None)
+
+    async def _run(self):
+        try:
+            while self.watchers:
+                await asyncio.sleep(self.interval)
+                await self.update()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Live queue of {self.service.commands[0]} failed: {e}")
+        finally:
+            logger.debug(f"Stopped live queue of {self.service.commands[0]}")
+
+    async def _fetch(self, page: int):
+        try:
+            items = await self.service.aget_queue(page=page, page_size=PAGE_SIZE)
+        except ServiceUnavailableError as e:
+            logger.warning(e)
+            return None
+        # Failed requests fall back to an empty list
+        return items if isinstance(items, dict) else None
+
+    async def update(self):
+        now = time.monotonic()
+        for key, watcher in list(self.watchers.items()):
+            if now - watcher.last_active > self.timeout:
+                logger.debug(f"Live queue of {key} timed out")
+                self.unwatch(*key)
+                await self._edit(watcher, watcher.state.items, live=False)
+
+        # One fetch per watched page, shared by all chats watching it
+        pages = sorted({w.state.page for w in self.watchers.values()})
+        results = await asyncio.gather(*[self._fetch(p) for p in pages])
+        queues = dict(zip(pages, results))
+
+        for key, watcher in list(self.watchers.items()):
+            items = queues.get(watcher.state.page)
+            if items is None:
+                continue
+            live = bool(items.get("totalRecords"))
+            if not live:
+                logger.debug(f"Queue of {key} is empty, stopping live updates")
+                self.unwatch(*key)
+            await self._edit(watcher, items, live)
+
+    async def _edit(self, watcher: Watcher, items: Dict[str, Any], live: bool):
+        key = (watcher.chat_id, watcher.message_id)
+        watcher.state = replace(watcher.state, items=items, live=live)
+        message = self.service.create_queue_message(watcher.state)
+        if live and message.caption == watcher.caption:
+            return
+        watcher.caption = message.caption
+
+        try:
+            await self.bot.edit_message_text(
+                message.caption,
+                chat_id=watcher.chat_id,
+                message_id=watcher.message_id,
+                reply_markup=message.reply_markup,
+                parse_mode=message.parse_mode,
+            )
+        except BadRequest as e:
+            if e.message not in no_edit_error_messages:
+                logger.debug(f"Could not update live queue of {key}: {e}")
+                self.unwatch(*key)
+        except TelegramError as e:
+            logger.warning(f"Could not update live queue of {key}: {e}")
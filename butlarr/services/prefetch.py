@@ -0,0 +1,96 @@
+import asyncio
+
+from loguru import logger
+from typing import Awaitable, Callable, Dict, Hashable, List
+
+import httpx
+
+from ..tg_handler.message import DEFAULT_POSTER, poster_cache
+
+# Prefetch jobs running at once, over all chats and services
+PREFETCH_CONCURRENCY = 4
+# Telegram does not fetch larger photos from urls either
+POSTER_MAX_BYTES = 5 * 1024 * 1024
+POSTER_TIMEOUT = 10.0
+# Statuses that mark a poster url as bad, others might just be transient
+POSTER_GONE_STATUS_CODES = (404, 410)
+
+Job = Callable[[], Awaitable]
+
+
+class Prefetcher:
+    """
+    Runs background jobs warming what a chat is likely to look at next.
+    Every chat (key) has at most one batch of jobs, scheduling a new one
+    cancels the previous batch. Jobs of all chats share `max_concurrent`
+    slots, so prefetching never competes with interactive requests for
+    more than a few connections.
+    """
+
+    max_concurrent: int
+
+    def __init__(self, max_concurrent: int = PREFETCH_CONCURRENCY):
+        self.max_concurrent = max_concurrent
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def schedule(self, key: Hashable, jobs: List[Job]):
+        self.cancel(key)
+        if jobs:
+            self.tasks[key] = asyncio.get_running_loop().create_task(
+                self._run(key, jobs)
+            )
+
+    def cancel(self, key: Hashable):
+        task = self.tasks.pop(key, None)
+        if task and not task.done():
+            task.cancel()
+
+    async def _run(self, key: Hashable, jobs: List[Job]):
+        try:
+            for job in jobs:
+                async with self.slots:
+                    await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Prefetching for {key} failed: {e!r}")
+        finally:
+            if self.tasks.get(key) is asyncio.current_task():
+                del self.tasks[key]
+
+
+prefetcher = Prefetcher()
+
+
+async def prefetch_poster(client: httpx.AsyncClient, url: str):
+    """Downloads a poster ahead of its first send, remembers unusable urls"""
+    if not url or url == DEFAULT_POSTER or poster_cache.has_poster(url):
+        return
+    try:
+        async with client.stream("GET", url, timeout=POSTER_TIMEOUT) as r:
+            if r.status_code in POSTER_GONE_STATUS_CODES or (
+                r.is_success
+                and not r.headers.get("content-type", "").startswith("image/")
+            ):
+                logger.debug(f"Poster [{url}] is not usable ({r.status_code})")
+                poster_cache.mark_bad(url)
+                return
+            if not r.is_success:
+                # Possibly transient (e.g. rate limited), left to Telegram
+                logger.debug(f"Could not prefetch poster [{url}] ({r.status_code})")
+                return
+            data = bytearray()
+            async for chunk in r.aiter_bytes():
+                data += chunk
+                if len(data) > POSTER_MAX_BYTES:
+                    # Left to Telegram, as before
+                    return
+    except httpx.HTTPError as e:
+        # Might just be this request, Telegram gets to try the url itself
+        logger.debug(f"Could not prefetch poster [{url}]: {e!r}")
+        return
+    poster_cache.set_bytes(url, bytes(data))
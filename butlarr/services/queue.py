@@ -0,0 +1,180 @@
+import asyncio
+import math
+import re
+import time
+
+from dataclasses import dataclass, replace
+from loguru import logger
+from typing import Any, Dict, List
+
+from . import ArrService
+from .ext import ExtArrService, create_queue_item_lines, queue_progress
+from ..circuit_breaker import ServiceUnavailableError
+from ..config.commands import QUEUE_COMMAND
+from ..config.queue import AGGREGATE_FETCH_SIZE, AGGREGATE_TIMEOUT, PAGE_SIZE
+from ..tg_handler import TelegramHandler, command, callback, handler
+from ..tg_handler import escape_markdownv2_chars
+from ..tg_handler.auth import authorized, AuthLevels
+from ..tg_handler.keyboard import Button, keyboard
+from ..tg_handler.message import Response, repaint
+from ..tg_handler.session_state import sessionState, default_session_state_key_fn
+
+TIMELEFT_REGEX = re.compile(r"^(?:(\d+)\.)?(\d+):(\d+):(\d+)")
+
+SORT_TIMELEFT = "timeleft"
+SORT_PROGRESS = "progress"
+
+
+def parse_timeleft(value) -> float:
+    """Seconds left of a `[d.]hh:mm:ss` timespan, unknown sorts last"""
+    match = TIMELEFT_REGEX.match(value or "")
+    if not match:
+        return math.inf
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+SORT_KEYS = {
+    SORT_TIMELEFT: lambda r: (parse_timeleft(r.get("timeleft")), -queue_progress(r)),
+    SORT_PROGRESS: lambda r: (-queue_progress(r), parse_timeleft(r.get("timeleft"))),
+}
+
+
+@dataclass(frozen=True)
+class AggregatedQueueState:
+    # Queue records of all services, each tagged with its service command
+    records: List[Dict[str, Any]]
+    unavailable: List[str]
+    page: int
+    sort: str
+
+
+@handler
+class AggregatedQueue(TelegramHandler):
+    """Combined download queue of all services supporting queues"""
+
+    session_db = ArrService.session_db
+
+    def __init__(self, services: List[TelegramHandler]):
+        self.commands = [QUEUE_COMMAND]
+        self.services = [s for s in services if isinstance(s, ExtArrService)]
+
+    async def _fetch(self, service: ExtArrService):
+        try:
+            return await asyncio.wait_for(
+                service.aget_queue_records(AGGREGATE_FETCH_SIZE), AGGREGATE_TIMEOUT
+            )
+        except ServiceUnavailableError as e:
+            logger.warning(e)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out fetching the queue of {service.commands[0]}")
+        return None
+
+    async def fetch_state(self, sort=SORT_TIMELEFT, page=0) -> AggregatedQueueState:
+        started = time.monotonic()
+        # Bounded by the slowest service, instead of the sum of all
+        results = await asyncio.gather(*[self._fetch(s) for s in self.services])
+
+        records = []
+        unavailable = []
+        for service, result in zip(self.services, results):
+            name = service.commands[0]
+            if result is None:
+                unavailable.append(name)
+                continue
+            records += [{**r, "service": name} for r in result]
+        logger.debug(
+            f"Fetched {len(records)} queue records of {len(self.services)} services in {time.monotonic() - started:.2f}s"
+        )
+
+        return AggregatedQueueState(
+            records=sorted(records, key=SORT_KEYS[sort]),
+            unavailable=unavailable,
+            page=page,
+            sort=sort,
+        )
+
+    @keyboard
+    def create_keyboard(self, state: AggregatedQueueState):
+        total_pages = max(0, math.ceil(len(state.records) / PAGE_SIZE) - 1)
+        other_sort = SORT_PROGRESS if state.sort == SORT_TIMELEFT else SORT_TIMELEFT
+        return [
+            [
+                (
+                    Button("Prev page", self.get_clbk("page", state.page - 1))
+                    if state.page > 0
+                    else Button()
+                ),
+                (
+                    Button("Next page", self.get_clbk("page", state.page + 1))
+                    if state.page < total_pages
+                    else Button()
+                ),
+            ],
+            [
+                Button(f"Sort by {other_sort}", self.get_clbk("sort", other_sort)),
+                Button("Refresh", self.get_clbk("refresh")),
+            ],
+        ]
+
+    def create_message(self, state: AggregatedQueueState):
+        lines = ["*Queue*", ""]
+        offset = state.page * PAGE_SIZE
+        for idx, item in enumerate(state.records[offset : offset + PAGE_SIZE]):
+            lines += create_queue_item_lines(offset + idx + 1, item, item["service"])
+
+        if not state.records:
+            n = PAGE_SIZE // 4
+            lines += [n * "\n", "\t_No Entries_", n * "\n"]
+        if state.unavailable:
+            unavailable = escape_markdownv2_chars(", ".join(state.unavailable))
+            lines += ["", f"_Not reachable: {unavailable}_"]
+
+        total_pages = max(0, math.ceil(len(state.records) / PAGE_SIZE) - 1)
+        lines.append(f"\t\tPage _{state.page}_ of _{total_pages}_")
+
+        return Response(
+            caption="\n".join(lines),
+            reply_markup=self.create_keyboard(state),
+            state=state,
+            parse_mode="MarkdownV2",
+        )
+
+    @repaint
+    @command(
+        default=True,
+        default_description="Shows the download queue of all services",
+    )
+    @sessionState(init=True)
+    @authorized(min_auth_level=AuthLevels.USER)
+    async def cmd_default(self, update, context, args):
+        state = await self.fetch_state()
+        self.session_db.add_session_entry(
+            default_session_state_key_fn(self, update), state
+        )
+        return self.create_message(state)
+
+    @repaint
+    @callback(cmds=["page", "sort", "refresh"])
+    @sessionState(optional=True)
+    @authorized(min_auth_level=AuthLevels.USER)
+    async def clbk_update(self, update, context, args, state):
+        if args[0] == "refresh" or state is None:
+            # Also covers sessions that expired in the meantime
+            state = await self.fetch_state(
+                sort=state.sort if state else SORT_TIMELEFT,
+                page=state.page if state else 0,
+            )
+        if args[0] == "page":
+            state = replace(state, page=int(args[1]))
+        elif args[0] == "sort":
+            state = replace(
+                state,
+                records=sorted(state.records, key=SORT_KEYS[args[1]]),
+                page=0,
+                sort=args[1],
+            )
+
+        total_pages = max(0, math.ceil(len(state.records) / PAGE_SIZE) - 1)
+        state = replace(state, page=min(state.page, total_pages))
+        return self.create_message(state)
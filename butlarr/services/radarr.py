@@ -2,7 +2,16 @@ from loguru import logger
 from typing import Optional, List, Any, Literal
 from dataclasses import dataclass, replace
 
-from . import ArrService, ArrVariant, Action, ServiceContent, find_first
+from . import (
+    ArrService,
+    ArrVariant,
+    Action,
+    ItemRef,
+    Listing,
+    ServiceContent,
+    find_first,
+)
+from .reference import ROOT_FOLDER, QUALITY_PROFILE, TAG
 from .ext import ExtArrService, QueueState
 from ..tg_handler import command, callback, handler
 from ..tg_handler.message import (
@@ -14,20 +23,29 @@ from ..tg_handler.auth import authorized, AuthLevels, get_auth_level_from_messag
 from ..tg_handler.session_state import (
     sessionState,
     default_session_state_key_fn,
+    EXPIRED_SESSION_CAPTION,
 )
 from ..tg_handler.keyboard import Button, keyboard
 
 
 @dataclass(frozen=True)
 class State:
-    items: List[Any]
+    items: List[ItemRef]
     index: int
     quality_profile: str
     tags: List[str]
     root_folder: str
     menu: Optional[
-        Literal["path"] | Literal["tags"] | Literal["quality_profile"] | Literal["add"]
+        Literal["path"]
+        | Literal["tags"]
+        | Literal["quality_profile"]
+        | Literal["add"]
+        | Literal["letters"]
     ]
+    # Only set for library listings
+    listing: Optional[Listing] = None
+    # Term of a lookup not merged yet, for searches answered from the library
+    lookup: Optional[str] = None
 
 
 @handler
@@ -37,29 +55,21 @@ class Radarr(ExtArrService, ArrService):
         commands: List[str],
         api_host: str,
         api_key: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
     ):
         self.commands = commands
         self.api_key = api_key
+        self.configure_transport(connect_timeout, read_timeout, retries)
 
-        self.api_version = self.detect_api(api_host)
+        self.init_api(api_host)
         self.service_content = ServiceContent.MOVIE
         self.arr_variant = ArrVariant.RADARR
-        self.root_folders = self.get_root_folders()
-        self.quality_profiles = self.get_quality_profiles()
-
-        if not self.root_folders:
-            logger.warning(
-                "No root folders configured! Please configure root folders inside the Sonarr interface. Otherwise Butlarr might not behave as expected."
-            )
-
-        if not self.quality_profiles:
-            logger.warning(
-                "No quality profiles configured! Please configure quality profiles inside the Sonarr interface. Otherwise Butlarr might not behave as expected."
-            )
+        self.init_reference_data([ROOT_FOLDER, QUALITY_PROFILE, TAG])
 
-    @keyboard
-    def keyboard(self, state: State, allow_edit=False):
-        item = state.items[state.index]
+    @keyboard(cache_key=ArrService.static_menu_key)
+    def keyboard(self, state: State, item, allow_edit=False):
         in_library = "id" in item and item["id"]
 
         rows_menu = []
@@ -91,7 +101,7 @@ class Radarr(ExtArrService, ArrService):
 
         elif state.menu == "tags":
             row_navigation = [Button("=== Selecting Tags ===")]
-            tags = self.get_tags() or []
+            tags = self.tags
             rows_menu = [
                 (
                     [
@@ -113,6 +123,9 @@ class Radarr(ExtArrService, ArrService):
                     )
                 ],
             ]
+        elif state.menu == "letters":
+            row_navigation = [Button("=== Jump to Letter ===")]
+            rows_menu = self.letter_rows()
         elif state.menu == "path":
             row_navigation = [Button("=== Selecting Root Folder ===")]
             rows_menu = [
@@ -145,10 +158,12 @@ class Radarr(ExtArrService, ArrService):
                         Button("💾 Missing" if missing else "Downloaded"),
                     ]
                 ]
+            rows_menu += self.listing_rows(state)
+            position, total = self.list_position(state)
             row_navigation = [
                 (
-                    Button("⬅ Prev", self.get_clbk("goto", state.index - 1))
-                    if state.index > 0
+                    Button("⬅ Prev", self.get_clbk("goto", position - 1))
+                    if position > 0
                     else Button()
                 ),
                 (
@@ -165,8 +180,8 @@ class Radarr(ExtArrService, ArrService):
                     else None
                 ),
                 (
-                    Button("Next ➡", self.get_clbk("goto", state.index + 1))
-                    if state.index < len(state.items) - 1
+                    Button("Next ➡", self.get_clbk("goto", position + 1))
+                    if position < total - 1
                     else Button()
                 ),
             ]
@@ -214,16 +229,16 @@ class Radarr(ExtArrService, ArrService):
 
         return [row_navigation, *rows_menu, *rows_action]
 
-    def create_message(self, state: State, full_redraw=False, allow_edit=False):
+    def create_message(
+        self, state: State, item=None, full_redraw=False, allow_edit=False
+    ):
         if not state.items:
             return Response(
                 caption="No movies found",
                 state=state,
             )
 
-        item = state.items[state.index]
-
-        keyboard_markup = self.keyboard(state, allow_edit=allow_edit)
+        keyboard_markup = self.keyboard(state, item, allow_edit=allow_edit)
 
         reply_message = f"{item['title']} "
         if item["year"] and str(item["year"]) not in item["title"]:
@@ -234,9 +249,7 @@ class Radarr(ExtArrService, ArrService):
 
         reply_message += f"- {item['status'].title()}\n\n{item.get('overview', '')}"
         reply_message = reply_message[0:1024]
-        cover_url = item.get("remotePoster")
-        if not cover_url and len(item.get("images")):
-            cover_url = item.get("images")[0]["remoteUrl"]
+        cover_url = self.poster_url(item)
 
         return Response(
             photo=cover_url if full_redraw else None,
@@ -247,7 +260,7 @@ class Radarr(ExtArrService, ArrService):
 
     def _get_initial_state(self, items):
         return State(
-            items=items,
+            items=self.remember_items(items),
             index=0,
             root_folder=(
                 find_first(
@@ -282,16 +295,22 @@ class Radarr(ExtArrService, ArrService):
         if len(args) > 1 and args[0] == "search":
             args = args[1:]
         title = " ".join(args)
-        items = self.lookup(title)
-        state = self._get_initial_state(items)
 
-        self.session_db.add_session_entry(
-            default_session_state_key_fn(self, update), state
-        )
+        items, lookup = await self.asearch(title)
+        state = replace(self._get_initial_state(items), lookup=lookup)
+
+        key = default_session_state_key_fn(self, update)
+        self.session_db.add_session_entry(key, state)
+        self.prefetch_neighbours(key, state)
 
         auth_level = get_auth_level_from_message(self.db, update)
         allow_edit = auth_level >= AuthLevels.MOD.value
-        return self.create_message(state, full_redraw=True, allow_edit=allow_edit)
+        return self.create_message(
+            state,
+            items[0] if items else None,
+            full_redraw=True,
+            allow_edit=allow_edit,
+        )
 
     @command(cmds=[("help", "", "Shows only the radarr help page")])
     async def cmd_help(self, update, context, args):
@@ -304,19 +323,57 @@ class Radarr(ExtArrService, ArrService):
         return await ExtArrService.cmd_queue(self, update, context, args)
 
     @repaint
-    @command(cmds=[("list", "", "List all series in the library")])
+    @command(cmds=[("list", "[<filter>]", "List all movies in the library")])
+    @sessionState(init=True)
     @authorized(min_auth_level=AuthLevels.USER.value)
     async def cmd_list(self, update, context, args):
-        items = self.list_()
-
-        state = self._get_initial_state(items)
-        self.session_db.add_session_entry(
-            default_session_state_key_fn(self, update), state
-        )
+        items, listing, _ = await self.list_window(" ".join(args[1:]))
+        state = replace(self._get_initial_state(items), listing=listing)
+        key = default_session_state_key_fn(self, update)
+        self.session_db.add_session_entry(key, state)
+        self.prefetch_neighbours(key, state)
 
         auth_level = get_auth_level_from_message(self.db, update)
         allow_edit = auth_level >= AuthLevels.MOD.value
-        return self.create_message(state, full_redraw=True, allow_edit=allow_edit)
+        return self.create_message(
+            state,
+            items[0] if items else None,
+            full_redraw=True,
+            allow_edit=allow_edit,
+        )
+
+    @repaint
+    @command(cmds=[("refresh", "", "Reloads the radarr profiles, folders and tags")])
+    @authorized(min_auth_level=AuthLevels.ADMIN)
+    async def cmd_refresh(self, update, context, args):
+        return await ExtArrService.cmd_refresh(self, update, context, args)
+
+    def import_options(self):
+        # Monitored, but not searched for all at once
+        return dict(
+            quality_profile_id=(self.quality_profiles or [{}])[0].get("id", 0),
+            root_folder_path=(self.root_folders or [{}])[0].get("path", ""),
+            options={"addOptions": {"searchForMovie": False}},
+        )
+
+    @command(
+        cmds=[
+            (
+                "import",
+                "<titles or ids>",
+                "Adds a list of movies, one per line or as .txt/.csv file",
+            )
+        ]
+    )
+    @authorized(min_auth_level=AuthLevels.MOD)
+    async def cmd_import(self, update, context, args):
+        return await ExtArrService.cmd_import(self, update, context, args)
+
+    @repaint
+    @command(cmds=[("stats", "", "Shows the radarr lookup cache statistics")])
+    @authorized(min_auth_level=AuthLevels.ADMIN)
+    async def cmd_stats(self, update, context, args):
+        return await ExtArrService.cmd_stats(self, update, context, args)
 
     @repaint
     @callback(cmds=["queue"])
@@ -328,6 +385,9 @@ class Radarr(ExtArrService, ArrService):
     @callback(
         cmds=[
             "goto",
+            "letters",
+            "letter",
+            "sort",
             "tags",
             "addtag",
             "remtag",
@@ -341,11 +401,14 @@ class Radarr(ExtArrService, ArrService):
     @sessionState()
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_update(self, update, context, args, state):
+        item = await self.current_item(state)
+        if not item:
+            # Gone from the caches and the Arr, the search is outdated
+            return Response(caption=EXPIRED_SESSION_CAPTION)
         auth_level = get_auth_level_from_message(self.db, update)
         allow_edit = auth_level >= AuthLevels.MOD.value
         # Prevent any changes from being made if in library and permission level below MOD
         if args[0] in ["addtag", "remtag", "selectpath", "selectquality"]:
-            item = state.items[state.index]
             if "id" in item and item["id"] and not allow_edit:
                 # Don't do anything, illegal operation
                 return Response(
@@ -353,13 +416,20 @@ class Radarr(ExtArrService, ArrService):
                 )
 
         full_redraw = False
-        if args[0] == "goto":
+        if args[0] in ["goto", "letter", "sort"]:
             if len(args) > 1:
-                idx = int(args[1])
-                item = state.items[idx]
+                if args[0] == "goto":
+                    state = await self.seek(state, int(args[1]))
+                elif args[0] == "letter":
+                    state = await self.seek(state, letter=args[1])
+                else:
+                    state = await self.seek(state, sort=args[1])
+                item = await self.current_item(state)
+                if not item:
+                    # Gone from the caches and the Arr, the search is outdated
+                    return Response(caption=EXPIRED_SESSION_CAPTION)
                 state = replace(
                     state,
-                    index=idx,
                     root_folder=find_first(
                         self.root_folders,
                         lambda x: item.get("folderName").startswith(x.get("path")),
@@ -372,8 +442,13 @@ class Radarr(ExtArrService, ArrService):
                     menu=None,
                 )
                 full_redraw = True
+                self.prefetch_neighbours(
+                    default_session_state_key_fn(self, update), state
+                )
             else:
                 state = replace(state, menu=None)
+        elif args[0] == "letters":
+            state = replace(state, menu="letters")
         elif args[0] == "tags":
             state = replace(state, tags=[], menu="tags")
         elif args[0] == "addtag":
@@ -383,18 +458,18 @@ class Radarr(ExtArrService, ArrService):
         elif args[0] == "path":
             state = replace(state, menu="path")
         elif args[0] == "selectpath":
-            path = self.get_root_folder(args[1])
+            path = await self.reference.aget(ROOT_FOLDER, args[1])
             state = replace(state, root_folder=path, menu="add")
         elif args[0] == "quality":
             state = replace(state, menu="quality")
         elif args[0] == "selectquality":
-            quality_profile = self.get_quality_profile(args[1])
+            quality_profile = await self.reference.aget(QUALITY_PROFILE, args[1])
             state = replace(state, quality_profile=quality_profile, menu="add")
         elif args[0] == "addmenu":
             state = replace(state, menu="add")
 
         return self.create_message(
-            state, full_redraw=full_redraw, allow_edit=allow_edit
+            state, item, full_redraw=full_redraw, allow_edit=allow_edit
         )
 
     @clear
@@ -402,8 +477,13 @@ class Radarr(ExtArrService, ArrService):
     @sessionState(clear=True)
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_add(self, update, context, args, state):
-        result = self.add(
-            item=state.items[state.index],
+        self.cancel_prefetch(default_session_state_key_fn(self, update))
+        item = await self.current_item(state)
+        if not item:
+            # Gone from the caches and the Arr, the search is outdated
+            return Response(caption=EXPIRED_SESSION_CAPTION)
+        result = await self.aadd(
+            item=item,
             quality_profile_id=state.quality_profile.get("id"),
             root_folder_path=state.root_folder.get("path"),
             tags=state.tags,
@@ -413,11 +493,7 @@ class Radarr(ExtArrService, ArrService):
             return Response(caption="Seems like something went wrong...")
 
         return Response(
-            caption=(
-                "Movie updated!"
-                if state.items[state.index].get("id")
-                else "Movie added!"
-            )
+            caption=("Movie updated!" if item.get("id") else "Movie added!")
         )
 
     @clear
@@ -425,6 +501,7 @@ class Radarr(ExtArrService, ArrService):
     @sessionState(clear=True)
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_cancel(self, update, context, args, state):
+        self.cancel_prefetch(default_session_state_key_fn(self, update))
         return Response(caption="Search canceled!")
 
     @clear
@@ -432,5 +509,6 @@ class Radarr(ExtArrService, ArrService):
     @sessionState(clear=True)
     @authorized(min_auth_level=AuthLevels.MOD)
     async def clbk_remove(self, update, context, args, state):
-        self.remove(id=state.items[state.index].get("id"))
+        self.cancel_prefetch(default_session_state_key_fn(self, update))
+        await self.aremove(id=state.items[state.index].id)
         return Response(caption="Movie removed!")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from loguru import logger
+from typing import Any, Dict, List, Optional
+
+from ..circuit_breaker import ServiceUnavailableError
+
+# Reference data kinds, named after the Arr endpoint they are fetched from
+ROOT_FOLDER = "rootfolder"
+QUALITY_PROFILE = "qualityprofile"
+LANGUAGE_PROFILE = "languageprofile"
+TAG = "tag"
+
+REFERENCE_NAMES = {
+    ROOT_FOLDER: "root folders",
+    QUALITY_PROFILE: "quality profiles",
+    LANGUAGE_PROFILE: "language profiles",
+    TAG: "tags",
+}
+
+DEFAULT_TTL = 300
+
+
+class ReferenceCache:
+    """
+    In-memory copy of the rarely changing reference data of an Arr service
+    (root folders, quality & language profiles, tags), indexed by id.
+
+    Reads never wait on the network: stale entries are served while a
+    background refresh is running.
+    """
+
+    service: Any
+    kinds: List[str]
+    ttl: float
+    version: int
+
+    def __init__(self, service, kinds: List[str], ttl: float = DEFAULT_TTL):
+        self.service = service
+        self.kinds = kinds
+        self.ttl = ttl
+        self.version = 0
+        self.items: Dict[str, List[Dict[str, Any]]] = {k: [] for k in kinds}
+        self.by_id: Dict[str, Dict[str, Dict[str, Any]]] = {k: {} for k in kinds}
+        self.fetched_at: Dict[str, float] = {k: 0.0 for k in kinds}
+        self.refreshing: Dict[str, asyncio.Task] = {}
+
+    def load(self, kind: str, items: Optional[List[Dict[str, Any]]]):
+        items = items or []
+        if items != self.items.get(kind):
+            # Lets dependent caches (e.g. keyboards) know they are outdated
+            self.version += 1
+        self.items[kind] = items
+        self.by_id[kind] = {str(i.get("id")): i for i in items}
+        self.fetched_at[kind] = time.monotonic()
+
+    def restore(self, items: Dict[str, List[Dict[str, Any]]]):
+        """Loads previously saved data, which is refreshed on next read"""
+        for kind in self.kinds:
+            if kind in items:
+                self.load(kind, items[kind])
+                self.fetched_at[kind] = 0.0
+
+    async def refresh(self, kind: Optional[str] = None):
+        kinds = [kind] if kind else self.kinds
+        results = await asyncio.gather(
+            *[self.service.arequest(k, fallback=None) for k in kinds],
+            return_exceptions=True,
+        )
+        for k, items in zip(kinds, results):
+            if isinstance(items, ServiceUnavailableError):
+                logger.warning(items)
+                continue
+            if isinstance(items, BaseException):
+                raise items
+            if items is None:
+                logger.warning(f"Could not refresh {k} of {self.service.commands[0]}")
+                continue
+            self.load(k, items)
+
+    def _schedule_refresh(self, kind: str):
+        task = self.refreshing.get(kind)
+        if task and not task.done():
+            return
+        try:
+            self.refreshing[kind] = asyncio.get_running_loop().create_task(
+                self.refresh(kind)
+            )
+        except RuntimeError:
+            # No running event loop (e.g. during startup), refresh on next read
+            pass
+
+    def is_stale(self, kind: str) -> bool:
+        return time.monotonic() - self.fetched_at.get(kind, 0.0) > self.ttl
+
+    def get_all(self, kind: str) -> List[Dict[str, Any]]:
+        if self.is_stale(kind):
+            self._schedule_refresh(kind)
+        return self.items.get(kind, [])
+
+    def get(self, kind: str, id) -> Dict[str, Any]:
+        if self.is_stale(kind):
+            self._schedule_refresh(kind)
+        return self.by_id.get(kind, {}).get(str(id), {})
+
+    async def aget(self, kind: str, id) -> Dict[str, Any]:
+        item = self.get(kind, id)
+        if not item:
+            # Unknown id, the entry was most likely created after our last refresh
+            await self.refresh(kind)
+            item = self.by_id.get(kind, {}).get(str(id), {})
+        return item
+
+    def invalidate(self, kind: Optional[str] = None):
+        for k in [kind] if kind else self.kinds:
+            self.fetched_at[k] = 0.0
+            self._schedule_refresh(k)
@@ -1,33 +1,51 @@
 from loguru import logger
-from typing import Optional, List, Any, Literal
+from datetime import datetime, timezone
+from typing import Optional, List, Any, Literal, Tuple
 from dataclasses import dataclass, replace
-from requests.models import Response
 
-from . import ArrService, ArrVariant, Action, ServiceContent, find_first
+from . import (
+    ArrService,
+    ArrVariant,
+    Action,
+    ItemRef,
+    Listing,
+    ServiceContent,
+    find_first,
+)
+from .reference import ROOT_FOLDER, QUALITY_PROFILE, LANGUAGE_PROFILE, TAG
 from .ext import ExtArrService
 from ..tg_handler import command, callback, handler
 from ..tg_handler.message import (
     Response,
     repaint,
     clear,
+    debounce,
 )
 from ..tg_handler.auth import authorized, AuthLevels, get_auth_level_from_message
 from ..tg_handler.session_state import (
     sessionState,
     default_session_state_key_fn,
+    EXPIRED_SESSION_CAPTION,
 )
 from ..tg_handler.keyboard import Button, keyboard
 
+# Seasons per row of the season menu
+SEASONS_PER_ROW = 3
+
 
 @dataclass(frozen=True)
 class SeasonState:
     available: List[int]
+    # Marked for the next search
     selected: List[int]
+    searched: Tuple[int, ...] = ()
+    # Outcome of the last search, shown above the seasons
+    notice: str = ""
 
 
 @dataclass(frozen=True)
 class State:
-    items: List[Any]
+    items: List[ItemRef]
     index: int
     quality_profile: str
     language_profile: str
@@ -42,7 +60,12 @@ class State:
         | Literal["language"]
         | Literal["useseasonfolder"]
         | Literal["add"]
+        | Literal["letters"]
     ]
+    # Only set for library listings
+    listing: Optional[Listing] = None
+    # Term of a lookup not merged yet, for searches answered from the library
+    lookup: Optional[str] = None
 
 
 @handler
@@ -52,31 +75,18 @@ class Sonarr(ExtArrService, ArrService):
         commands: List[str],
         api_host: str,
         api_key: str,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        retries: Optional[int] = None,
     ):
         self.commands = commands
         self.api_key = api_key
+        self.configure_transport(connect_timeout, read_timeout, retries)
 
-        self.api_version = self.detect_api(api_host)
+        self.init_api(api_host)
         self.service_content = ServiceContent.SERIES
         self.arr_variant = ArrVariant.SONARR
-        self.root_folders = self.get_root_folders()
-        self.quality_profiles = self.get_quality_profiles()
-        self.language_profiles = self.get_language_profiles()
-
-        if not self.root_folders:
-            logger.warning(
-                "No root folders configured! Please configure root folders inside the Sonarr interface. Otherwise Butlarr might not behave as expected."
-            )
-
-        if not self.quality_profiles:
-            logger.warning(
-                "No quality profiles configured! Please configure quality profiles inside the Sonarr interface. Otherwise Butlarr might not behave as expected."
-            )
-
-        if not self.language_profiles:
-            logger.warning(
-                "No language profiles configured! Please configure language profiles inside the Sonarr interface. Otherwise Butlarr might not behave as expected."
-            )
+        self.init_reference_data([ROOT_FOLDER, QUALITY_PROFILE, LANGUAGE_PROFILE, TAG])
 
     def _get_season_state(self, item):
         available_seasons = [e.get("seasonNumber") for e in item.get("seasons")]
@@ -87,9 +97,8 @@ class Sonarr(ExtArrService, ArrService):
             monitored_seasons,
         )
 
-    @keyboard
-    def keyboard(self, state: State, allow_edit=None):
-        item = state.items[state.index]
+    @keyboard(cache_key=ArrService.static_menu_key)
+    def keyboard(self, state: State, item, allow_edit=None):
         in_library = "id" in item and item["id"]
 
         rows_menu = []
@@ -132,26 +141,46 @@ class Sonarr(ExtArrService, ArrService):
             ]
 
         elif state.menu == "seasons":
-            row_navigation = [Button("=== Search for Seasons ===")]
+            seasons = state.seasons
+            row_navigation = [
+                Button(f"=== {seasons.notice or 'Search for Seasons'} ===")
+            ]
+            buttons = [
+                Button(
+                    f"{'☑' if id in seasons.selected else ('✔' if id in seasons.searched else '⬜')} Season {id}",
+                    self.get_clbk("toggleseason", id),
+                )
+                for id in seasons.available
+            ]
             rows_menu = [
+                buttons[i : i + SEASONS_PER_ROW]
+                for i in range(0, len(buttons), SEASONS_PER_ROW)
+            ]
+            all_selected = set(seasons.available) <= set(seasons.selected)
+            rows_menu.append(
                 [
                     Button(
-                        f"{'✔' if id in state.seasons.selected else '🔍'} Season {id}",
-                        self.get_clbk(
-                            (
-                                "noop"
-                                if id in state.seasons.selected
-                                else "searchseason"
-                            ),
-                            id,
-                        ),
-                    )
+                        "Select none" if all_selected else "Select all",
+                        self.get_clbk("toggleseason", "all"),
+                    ),
+                    *(
+                        [
+                            Button(
+                                f"🔍 Search selected ({len(seasons.selected)})",
+                                self.get_clbk("searchselected"),
+                            )
+                        ]
+                        if seasons.selected
+                        else []
+                    ),
                 ]
-                for id in state.seasons.available
-            ]
+            )
+            rows_menu.append(
+                [Button("🔍 Search all missing", self.get_clbk("searchmissing"))]
+            )
         elif state.menu == "tags":
             row_navigation = [Button("=== Selecting Tags ===")]
-            tags = self.get_tags() or []
+            tags = self.tags
             rows_menu = [
                 (
                     [
@@ -173,6 +202,9 @@ class Sonarr(ExtArrService, ArrService):
                     )
                 ],
             ]
+        elif state.menu == "letters":
+            row_navigation = [Button("=== Jump to Letter ===")]
+            rows_menu = self.letter_rows()
         elif state.menu == "path":
             row_navigation = [Button("=== Selecting Root Folder ===")]
             rows_menu = [
@@ -233,10 +265,12 @@ class Sonarr(ExtArrService, ArrService):
                         Button("💾 Missing" if missing else "Downloaded"),
                     ],
                 ]
+            rows_menu += self.listing_rows(state)
+            position, total = self.list_position(state)
             row_navigation = [
                 (
-                    Button("⬅ Prev", self.get_clbk("goto", state.index - 1))
-                    if state.index > 0
+                    Button("⬅ Prev", self.get_clbk("goto", position - 1))
+                    if position > 0
                     else Button()
                 ),
                 (
@@ -254,8 +288,8 @@ class Sonarr(ExtArrService, ArrService):
                     else None
                 ),
                 (
-                    Button("Next ➡", self.get_clbk("goto", state.index + 1))
-                    if state.index < len(state.items) - 1
+                    Button("Next ➡", self.get_clbk("goto", position + 1))
+                    if position < total - 1
                     else Button()
                 ),
             ]
@@ -310,7 +344,7 @@ class Sonarr(ExtArrService, ArrService):
                         "🔙 Back",
                         self.get_clbk(
                             "goto"
-                            if state.menu and state.menu == "seasons"
+                            if state.menu in ["seasons", "letters"]
                             else (
                                 "addmenu"
                                 if state.menu and state.menu != "add"
@@ -325,16 +359,16 @@ class Sonarr(ExtArrService, ArrService):
 
         return [row_navigation, *rows_menu, *rows_action]
 
-    def create_message(self, state: State, full_redraw=False, allow_edit=False):
+    def create_message(
+        self, state: State, item=None, full_redraw=False, allow_edit=False
+    ):
         if not state.items:
             return Response(
                 caption="No series found",
                 state=state,
             )
 
-        item = state.items[state.index]
-
-        keyboard_markup = self.keyboard(state, allow_edit=allow_edit)
+        keyboard_markup = self.keyboard(state, item, allow_edit=allow_edit)
 
         reply_message = f"{item['title']} "
         if item["year"] and str(item["year"]) not in item["title"]:
@@ -346,9 +380,7 @@ class Sonarr(ExtArrService, ArrService):
         reply_message += f"- {item['status'].title()}\n\n{item.get('overview', '')}"
         reply_message = reply_message[0:1024]
 
-        cover_url = item.get("remotePoster")
-        if not cover_url and len(item.get("images")):
-            cover_url = item.get("images")[0]["remoteUrl"]
+        cover_url = self.poster_url(item)
 
         return Response(
             photo=cover_url if full_redraw else None,
@@ -357,9 +389,9 @@ class Sonarr(ExtArrService, ArrService):
             state=state,
         )
 
-    def _get_initial_state(self, items):
+    async def _get_initial_state(self, items):
         return State(
-            items=items,
+            items=self.remember_items(items),
             index=0,
             root_folder=(
                 find_first(
@@ -387,12 +419,17 @@ class Sonarr(ExtArrService, ArrService):
             ),
             tags=items[0].get("tags", []) if items else None,
             menu=None,
-            seasons=self._get_season_state(items[0]),
-            use_season_folder=self.get_use_season_folder(items[0]),
+            seasons=self._get_season_state(items[0]) if items else None,
+            use_season_folder=(
+                await self.aget_use_season_folder(items[0]) if items else True
+            ),
         )
 
-    def get_use_season_folder(self, id):
-        return self.request(f"series/{id}", fallback={})
+    async def aget_use_season_folder(self, item):
+        if not item.get("id"):
+            return item.get("seasonFolder", True)
+        series = await self.arequest(f"series/{item['id']}", fallback={})
+        return series.get("seasonFolder", True)
 
     @repaint
     @command(
@@ -408,17 +445,22 @@ class Sonarr(ExtArrService, ArrService):
             args = args[1:]
         title = " ".join(args)
 
-        items = self.lookup(title)
+        items, lookup = await self.asearch(title)
 
-        state = self._get_initial_state(items)
+        state = replace(await self._get_initial_state(items), lookup=lookup)
 
-        self.session_db.add_session_entry(
-            default_session_state_key_fn(self, update), state
-        )
+        key = default_session_state_key_fn(self, update)
+        self.session_db.add_session_entry(key, state)
+        self.prefetch_neighbours(key, state)
 
         auth_level = get_auth_level_from_message(self.db, update)
         allow_edit = auth_level >= AuthLevels.MOD.value
-        return self.create_message(state, full_redraw=True, allow_edit=allow_edit)
+        return self.create_message(
+            state,
+            items[0] if items else None,
+            full_redraw=True,
+            allow_edit=allow_edit,
+        )
 
     @command(cmds=[("help", "", "Shows only the sonarr help page")])
     async def cmd_help(self, update, context, args):
@@ -430,6 +472,43 @@ class Sonarr(ExtArrService, ArrService):
     async def cmd_queue(self, update, context, args):
         return await ExtArrService.cmd_queue(self, update, context, args)
 
+    @repaint
+    @command(cmds=[("refresh", "", "Reloads the sonarr profiles, folders and tags")])
+    @authorized(min_auth_level=AuthLevels.ADMIN)
+    async def cmd_refresh(self, update, context, args):
+        return await ExtArrService.cmd_refresh(self, update, context, args)
+
+    def import_options(self):
+        # Monitored, but not searched for all at once
+        return dict(
+            quality_profile_id=(self.quality_profiles or [{}])[0].get("id", 0),
+            language_profile_id=(self.language_profiles or [{}])[0].get("id", 0),
+            root_folder_path=(self.root_folders or [{}])[0].get("path", ""),
+            options={
+                "seasonFolder": True,
+                "addOptions": {"searchForMissingEpisodes": False, "monitor": "all"},
+            },
+        )
+
+    @command(
+        cmds=[
+            (
+                "import",
+                "<titles or ids>",
+                "Adds a list of series, one per line or as .txt/.csv file",
+            )
+        ]
+    )
+    @authorized(min_auth_level=AuthLevels.MOD)
+    async def cmd_import(self, update, context, args):
+        return await ExtArrService.cmd_import(self, update, context, args)
+
+    @repaint
+    @command(cmds=[("stats", "", "Shows the sonarr lookup cache statistics")])
+    @authorized(min_auth_level=AuthLevels.ADMIN)
+    async def cmd_stats(self, update, context, args):
+        return await ExtArrService.cmd_stats(self, update, context, args)
+
     @repaint
     @callback(cmds=["queue"])
     @authorized(min_auth_level=AuthLevels.USER.value)
@@ -437,24 +516,32 @@ class Sonarr(ExtArrService, ArrService):
         return await ExtArrService.clbk_queue(self, update, context, args)
 
     @repaint
-    @command(cmds=[("list", "", "List all series in the library")])
+    @command(cmds=[("list", "[<filter>]", "List all series in the library")])
+    @sessionState(init=True)
     @authorized(min_auth_level=AuthLevels.USER.value)
     async def cmd_list(self, update, context, args):
-        items = self.list_()
-
-        state = self._get_initial_state(items)
-        self.session_db.add_session_entry(
-            default_session_state_key_fn(self, update), state
-        )
+        items, listing, _ = await self.list_window(" ".join(args[1:]))
+        state = replace(await self._get_initial_state(items), listing=listing)
+        key = default_session_state_key_fn(self, update)
+        self.session_db.add_session_entry(key, state)
+        self.prefetch_neighbours(key, state)
 
         auth_level = get_auth_level_from_message(self.db, update)
         allow_edit = auth_level >= AuthLevels.MOD.value
-        return self.create_message(state, full_redraw=True, allow_edit=allow_edit)
+        return self.create_message(
+            state,
+            items[0] if items else None,
+            full_redraw=True,
+            allow_edit=allow_edit,
+        )
 
     @repaint
     @callback(
         cmds=[
             "goto",
+            "letters",
+            "letter",
+            "sort",
             "tags",
             "addtag",
             "remtag",
@@ -474,6 +561,10 @@ class Sonarr(ExtArrService, ArrService):
     @sessionState()
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_update(self, update, context, args, state):
+        item = await self.current_item(state)
+        if not item:
+            # Gone from the caches and the Arr, the search is outdated
+            return Response(caption=EXPIRED_SESSION_CAPTION)
         auth_level = get_auth_level_from_message(self.db, update)
         allow_edit = auth_level >= AuthLevels.MOD.value
         # Prevent any changes from being made if in library and permission level below MOD
@@ -485,7 +576,6 @@ class Sonarr(ExtArrService, ArrService):
             "selectlanguage",
             "searchseason",
         ]:
-            item = state.items[state.index]
             if "id" in item and item["id"] and not allow_edit:
                 # Don't do anything, illegal operation
                 return Response(
@@ -493,13 +583,20 @@ class Sonarr(ExtArrService, ArrService):
                 )
 
         full_redraw = False
-        if args[0] == "goto":
+        if args[0] in ["goto", "letter", "sort"]:
             if len(args) > 1:
-                idx = int(args[1])
-                item = state.items[idx]
+                if args[0] == "goto":
+                    state = await self.seek(state, int(args[1]))
+                elif args[0] == "letter":
+                    state = await self.seek(state, letter=args[1])
+                else:
+                    state = await self.seek(state, sort=args[1])
+                item = await self.current_item(state)
+                if not item:
+                    # Gone from the caches and the Arr, the search is outdated
+                    return Response(caption=EXPIRED_SESSION_CAPTION)
                 state = replace(
                     state,
-                    index=idx,
                     root_folder=find_first(
                         self.root_folders,
                         lambda x: item.get("folderName").startswith(x.get("path")),
@@ -514,12 +611,15 @@ class Sonarr(ExtArrService, ArrService):
                     seasons=self._get_season_state(item),
                 )
                 full_redraw = True
+                self.prefetch_neighbours(
+                    default_session_state_key_fn(self, update), state
+                )
             else:
                 state = replace(state, menu=None)
         elif args[0] == "seasons":
             state = replace(state, menu="seasons")
         elif args[0] == "searchseason":
-            self.request(
+            await self.arequest(
                 "command",
                 action=Action.POST,
                 params={
@@ -528,9 +628,11 @@ class Sonarr(ExtArrService, ArrService):
                     "seasonNumber": args[1],
                 },
             )
-            new_selected = [*state.seasons.selected, int(args[1])]
-            season_state = replace(state.seasons, selected=new_selected)
+            searched = (*state.seasons.searched, int(args[1]))
+            season_state = replace(state.seasons, searched=searched)
             state = replace(state, seasons=season_state)
+        elif args[0] == "letters":
+            state = replace(state, menu="letters")
         elif args[0] == "tags":
             state = replace(state, tags=[], menu="tags")
         elif args[0] == "addtag":
@@ -540,40 +642,139 @@ class Sonarr(ExtArrService, ArrService):
         elif args[0] == "path":
             state = replace(state, menu="path")
         elif args[0] == "selectpath":
-            path = self.get_root_folder(args[1])
+            path = await self.reference.aget(ROOT_FOLDER, args[1])
             state = replace(state, root_folder=path, menu="add")
         elif args[0] == "quality":
             state = replace(state, menu="quality")
         elif args[0] == "selectquality":
-            quality_profile = self.get_quality_profile(args[1])
+            quality_profile = await self.reference.aget(QUALITY_PROFILE, args[1])
             state = replace(state, quality_profile=quality_profile, menu="add")
         elif args[0] == "language":
             state = replace(state, menu="language")
         elif args[0] == "selectlanguage":
-            language_profile = self.get_language_profile(args[1])
+            language_profile = await self.reference.aget(LANGUAGE_PROFILE, args[1])
             state = replace(state, language_profile=language_profile, menu="add")
         elif args[0] == "addmenu":
             state = replace(state, menu="add")
         elif args[0] == "useseasonfolder":
             # state = replace(state, menu="useseasonfolder")
             # use_season_folder = eval(args[1])
-            state = replace(state, use_season_folder=(not state.use_season_folder), menu="add")
+            state = replace(
+                state, use_season_folder=(not state.use_season_folder), menu="add"
+            )
         elif args[0] == "selectuseseasonfolder":
             use_season_folder = eval(args[1])
             state = replace(state, use_season_folder=use_season_folder, menu="add")
 
-
         return self.create_message(
-            state, full_redraw=full_redraw, allow_edit=allow_edit
+            state, item, full_redraw=full_redraw, allow_edit=allow_edit
         )
 
+    async def asearch_episodes(self, series_id, episodes, targets):
+        """
+        Searches the monitored `targets` among the `episodes` of a series
+        with a single command: a SeriesSearch if they are all monitored
+        episodes, a SeasonSearch if they are all of one season, otherwise an
+        EpisodeSearch of their ids.
+        """
+        ids = {e["id"] for e in targets if e.get("monitored")}
+        if not ids:
+            return None
+        monitored = [e for e in episodes if e.get("monitored")]
+        seasons = {e.get("seasonNumber") for e in targets if e["id"] in ids}
+        season = next(iter(seasons)) if len(seasons) == 1 else None
+        if ids >= {e["id"] for e in monitored}:
+            params = {"name": "SeriesSearch", "seriesId": series_id}
+        elif season is not None and ids >= {
+            e["id"] for e in monitored if e.get("seasonNumber") == season
+        }:
+            params = {
+                "name": "SeasonSearch",
+                "seriesId": series_id,
+                "seasonNumber": season,
+            }
+        else:
+            params = {"name": "EpisodeSearch", "episodeIds": sorted(ids)}
+        return await self.arequest("command", action=Action.POST, params=params)
+
+    @staticmethod
+    def is_missing(episode, now=None):
+        """Monitored, aired and not downloaded"""
+        air_date = episode.get("airDateUtc")
+        if not air_date or episode.get("hasFile") or not episode.get("monitored"):
+            return False
+        now = now or datetime.now(timezone.utc)
+        return datetime.fromisoformat(air_date.replace("Z", "+00:00")) <= now
+
+    @repaint
+    @debounce
+    @callback(cmds=["toggleseason", "searchselected", "searchmissing"])
+    @sessionState()
+    @authorized(min_auth_level=AuthLevels.USER)
+    async def clbk_seasons(self, update, context, args, state):
+        item = await self.current_item(state)
+        if not item:
+            # Gone from the caches and the Arr, the search is outdated
+            return Response(caption=EXPIRED_SESSION_CAPTION)
+        auth_level = get_auth_level_from_message(self.db, update)
+        allow_edit = auth_level >= AuthLevels.MOD.value
+        # Searching library entries is limited to MOD, like the other changes
+        if item.get("id") and not allow_edit:
+            return Response(
+                caption="You are missing the permissions for this operation.",
+                state=state,
+            )
+        seasons = replace(state.seasons, notice="")
+
+        if args[0] == "toggleseason":
+            if args[1] == "all":
+                all_selected = set(seasons.available) <= set(seasons.selected)
+                selected = [] if all_selected else list(seasons.available)
+            elif int(args[1]) in seasons.selected:
+                selected = [s for s in seasons.selected if s != int(args[1])]
+            else:
+                selected = [*seasons.selected, int(args[1])]
+            seasons = replace(seasons, selected=selected)
+        elif args[0] in ["searchselected", "searchmissing"]:
+            episodes = await self.arequest(
+                "episode", params={"seriesId": item.get("id")}, fallback=[]
+            )
+            if args[0] == "searchselected":
+                targets = [
+                    e for e in episodes if e.get("seasonNumber") in seasons.selected
+                ]
+            else:
+                targets = [e for e in episodes if self.is_missing(e)]
+            result = await self.asearch_episodes(item.get("id"), episodes, targets)
+            count = len([e for e in targets if e.get("monitored")])
+            season_numbers = {e.get("seasonNumber") for e in targets}
+            if result:
+                seasons = replace(
+                    seasons,
+                    selected=[],
+                    searched=tuple(sorted({*seasons.searched, *season_numbers})),
+                    notice=f"Searching {count} episodes",
+                )
+            elif not count:
+                seasons = replace(seasons, notice="Nothing to search for")
+            else:
+                seasons = replace(seasons, notice="Search failed")
+
+        state = replace(state, seasons=seasons, menu="seasons")
+        return self.create_message(state, item, allow_edit=allow_edit)
+
     @clear
     @callback(cmds=["add"])
     @sessionState(clear=True)
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_add(self, update, context, args, state):
-        result = self.add(
-            item=state.items[state.index],
+        self.cancel_prefetch(default_session_state_key_fn(self, update))
+        item = await self.current_item(state)
+        if not item:
+            # Gone from the caches and the Arr, the search is outdated
+            return Response(caption=EXPIRED_SESSION_CAPTION)
+        result = await self.aadd(
+            item=item,
             quality_profile_id=state.quality_profile.get("id", 0),
             language_profile_id=state.language_profile.get("id", 0),
             root_folder_path=state.root_folder.get("path", ""),
@@ -590,11 +791,7 @@ class Sonarr(ExtArrService, ArrService):
             return Response(caption="Seems like something went wrong...")
 
         return Response(
-            caption=(
-                "Series updated!"
-                if state.items[state.index].get("id")
-                else "Series added!"
-            )
+            caption=("Series updated!" if item.get("id") else "Series added!")
         )
 
     @clear
@@ -602,6 +799,7 @@ class Sonarr(ExtArrService, ArrService):
     @sessionState(clear=True)
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_cancel(self, update, context, args, state):
+        self.cancel_prefetch(default_session_state_key_fn(self, update))
         return Response(caption="Search canceled!")
 
     @clear
@@ -609,5 +807,6 @@ class Sonarr(ExtArrService, ArrService):
     @sessionState(clear=True)
     @authorized(min_auth_level=AuthLevels.USER)
     async def clbk_remove(self, update, context, args, state):
-        self.remove(id=state.items[state.index].get("id"))
+        self.cancel_prefetch(default_session_state_key_fn(self, update))
+        await self.aremove(id=state.items[state.index].id)
         return Response(caption="Series removed!")
@@ -1,53 +1,309 @@
+import asyncio
 import os
 import pickle
-import re
+import queue
+import sqlite3
+import threading
+import time
 
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
 from loguru import logger
 from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 BASE_PATH = os.path.join(
     Path(os.path.dirname(os.path.realpath(__file__))).parent, "data", "session"
 )
 
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_FLUSH_INTERVAL = 30
+
+EntryKey = Tuple[str, str]
+
+
+class SqliteSessionBackend:
+    """
+    Durable storage for session entries, written in batches.
+    The file is only opened on first use.
+    """
+
+    db_file: Path
+
+    def __init__(self, db_file: Path):
+        self.db_file = Path(db_file)
+        self._con: Optional[sqlite3.Connection] = None
+
+    @property
+    def con(self) -> sqlite3.Connection:
+        if self._con is None:
+            self.db_file.parent.mkdir(exist_ok=True, parents=True)
+            con = sqlite3.connect(self.db_file, check_same_thread=False)
+            con.execute("PRAGMA journal_mode = WAL;")
+            con.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                    session_id text not null,
+                    key text not null,
+                    expires_at real not null,
+                    value blob not null,
+                    primary key (session_id, key)
+                );""")
+            con.commit()
+            self._con = con
+        return self._con
+
+    def load(self, entry_key: EntryKey) -> Optional[Tuple[float, bytes]]:
+        row = self.con.execute(
+            "SELECT expires_at, value FROM sessions WHERE session_id=? AND key=?;",
+            entry_key,
+        ).fetchone()
+        if not row or row[0] < time.time():
+            return None
+        return row
+
+    def write(
+        self,
+        stored: Iterable[Tuple[EntryKey, float, bytes]],
+        cleared: Iterable[str],
+    ):
+        with self.con:
+            # Clears happened before any of the pending stores
+            self.con.executemany(
+                "DELETE FROM sessions WHERE session_id=?;", [(c,) for c in cleared]
+            )
+            self.con.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, key, expires_at, value) VALUES (?, ?, ?, ?);",
+                [(sid, key, exp, value) for (sid, key), exp, value in stored],
+            )
+            self.con.execute(
+                "DELETE FROM sessions WHERE expires_at < ?;", (time.time(),)
+            )
+
+    def close(self):
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
 
 class SessionDatabase:
+    """
+    Bounded in-memory session store.
+    Entries expire after `ttl` seconds, and the least recently used entries
+    are evicted once `max_entries` or `max_bytes` is exceeded.
+    If `persist` is set, changes are written to a SQLite file every
+    `flush_interval` seconds (and on `flush()`), instead of on every change.
+    Writes and loads of the SQLite file run on a worker thread, started on
+    first use; `aget_session_entry` awaits loads instead of blocking.
+    """
+
     lock = Lock()
     base_path: Path
 
-    def __init__(self, base_path=BASE_PATH):
+    def __init__(
+        self,
+        base_path=BASE_PATH,
+        *,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        persist: bool = True,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
         self.base_path = Path(base_path)
-        # Make sure the path exists
-        self.base_path.mkdir(exist_ok=True, parents=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+
+        # (session_id, key) -> (expires_at, size, value)
+        self.entries: OrderedDict[EntryKey, Tuple[float, int, Any]] = OrderedDict()
+        self.sessions: Dict[str, Set[str]] = {}
+        self.size = 0
+
+        # Changes not yet written to the backend
+        self.pending: Dict[EntryKey, Tuple[float, bytes]] = {}
+        self.pending_clears: Set[str] = set()
+        self.last_flush = time.monotonic()
+
+        self.backend = (
+            SqliteSessionBackend(self.base_path.with_suffix(".sqlite"))
+            if persist
+            else None
+        )
+        self.jobs: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self.worker: Optional[threading.Thread] = None
+
+    def _submit(self, fn: Callable[[], object]) -> Future:
+        future: Future = Future()
+        if not self.worker:
+            self.worker = threading.Thread(
+                target=self._work, name="butlarr-sessions", daemon=True
+            )
+            self.worker.start()
+        self.jobs.put((fn, future))
+        return future
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fn, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+        if self.backend:
+            self.backend.close()
+
+    def close(self):
+        """Writes the pending changes and stops the worker"""
+        self.flush()
+        if self.worker and self.worker.is_alive():
+            self.jobs.put(None)
+            self.worker.join()
+
+    def _drop(self, entry_key: EntryKey):
+        _, size, _ = self.entries.pop(entry_key)
+        self.size -= size
+        keys = self.sessions.get(entry_key[0])
+        if keys is not None:
+            keys.discard(entry_key[1])
+            if not keys:
+                del self.sessions[entry_key[0]]
+
+    def _store(self, entry_key: EntryKey, expires_at: float, size: int, value):
+        if entry_key in self.entries:
+            self._drop(entry_key)
+        self.entries[entry_key] = (expires_at, size, value)
+        self.sessions.setdefault(entry_key[0], set()).add(entry_key[1])
+        self.size += size
+
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.size > self.max_bytes
+        ):
+            evicted, _ = next(iter(self.entries.items()))
+            logger.debug(f"Evicting session data of {evicted}")
+            self._drop(evicted)
 
     def add_session_entry(self, session_id, value, *, key=None):
-        file_name = f"{session_id}.{key}" if key else str(session_id)
-        file_path = os.path.join(self.base_path, file_name)
+        entry_key = (str(session_id), key or "")
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = time.time() + self.ttl
+
+        logger.debug(f"Adding session data for {entry_key} ({len(data)} bytes)")
+        with self.lock:
+            self._store(entry_key, expires_at, len(data), value)
+            if self.backend:
+                self.pending[entry_key] = (expires_at, data)
+        self._maybe_flush()
+
+    def _get_cached(self, entry_key: EntryKey) -> Tuple[bool, Any]:
+        # Returns whether the backend can be skipped, and the value if so
+        with self.lock:
+            entry = self.entries.get(entry_key)
+            if entry:
+                expires_at, _, value = entry
+                if expires_at >= time.time():
+                    self.entries.move_to_end(entry_key)
+                    return True, value
+                self._drop(entry_key)
+                return True, None
+
+            # Not in memory (anymore), try the durable store
+            if not self.backend:
+                return True, None
+            stored = self.pending.get(entry_key)
+            if not stored and entry_key[0] in self.pending_clears:
+                return True, None
+        if stored:
+            return True, self._restore(entry_key, stored)
+        return False, None
 
-        logger.debug(f"Adding session data for {file_name}")
-        # logger.debug(f"Value {value}")
-        with open(file_path, mode="wb+") as file:
-            pickle.dump(value, file)
+    def _restore(self, entry_key: EntryKey, stored: Optional[Tuple[float, bytes]]):
+        if not stored or stored[0] < time.time():
+            return None
+        expires_at, data = stored
+        value = pickle.loads(data)
+        with self.lock:
+            # Changed while it was loading, the newer value wins
+            if entry_key in self.entries:
+                return self.entries[entry_key][2]
+            self._store(entry_key, expires_at, len(data), value)
+        return value
+
+    def _load(self, entry_key: EntryKey) -> Future:
+        return self._submit(lambda: self.backend.load(entry_key))
 
     def get_session_entry(self, session_id, *, key=None):
-        file_name = f"{session_id}.{key}" if key else str(session_id)
-        file_path = os.path.join(self.base_path, file_name)
+        entry_key = (str(session_id), key or "")
+
+        logger.debug(f"Fetching session data of {entry_key}")
+        cached, value = self._get_cached(entry_key)
+        if cached:
+            return value
+        return self._restore(entry_key, self._load(entry_key).result())
 
-        logger.debug(f"Fetching session data of {file_name}")
-        with open(file_path, mode="rb+") as file:
-            result = pickle.load(file)
-            # logger.debug(f"Result {result}")
-            return result
+    async def aget_session_entry(self, session_id, *, key=None):
+        entry_key = (str(session_id), key or "")
+
+        logger.debug(f"Fetching session data of {entry_key}")
+        cached, value = self._get_cached(entry_key)
+        if cached:
+            return value
+        stored = await asyncio.wrap_future(self._load(entry_key))
+        return self._restore(entry_key, stored)
 
     def clear_session(self, session_id):
-        file_regex = r"{session_id}\..*"
-        all_files = os.listdir(self.base_path)
+        session_id = str(session_id)
 
         logger.debug(f"Clearing session data of {session_id}")
-        for file in all_files:
-            if not re.match(file_regex, file):
-                continue
+        with self.lock:
+            for key in list(self.sessions.get(session_id, [])):
+                self._drop((session_id, key))
+            if self.backend:
+                for entry_key in [k for k in self.pending if k[0] == session_id]:
+                    del self.pending[entry_key]
+                self.pending_clears.add(session_id)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            now = time.time()
+            for entry_key in [k for k, e in self.entries.items() if e[0] < now]:
+                self._drop(entry_key)
+
+            if not self.backend or not (self.pending or self.pending_clears):
+                return
+            stored: List[Tuple[EntryKey, float, bytes]] = [
+                (k, v[0], v[1]) for k, v in self.pending.items()
+            ]
+            cleared = list(self.pending_clears)
+            self.pending = {}
+            self.pending_clears = set()
+
+        logger.debug(
+            f"Flushing {len(stored)} session entries and {len(cleared)} cleared sessions"
+        )
+        self._submit(lambda: self._write(stored, cleared))
 
-            file_path = os.path.join(self.base_path, file)
-            logger.debug(f"Deleting {file}")
-            os.remove(file_path)
+    def _write(self, stored: List[Tuple[EntryKey, float, bytes]], cleared: List[str]):
+        try:
+            self.backend.write(stored, cleared)
+        except sqlite3.Error as e:
+            logger.error(f"Error persisting session data, retrying later: {e}")
+            with self.lock:
+                # Put the batch back, unless it was superseded in the meantime
+                for entry_key, expires_at, data in stored:
+                    if entry_key[0] not in self.pending_clears:
+                        self.pending.setdefault(entry_key, (expires_at, data))
+                self.pending_clears.update(cleared)
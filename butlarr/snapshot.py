@@ -0,0 +1,97 @@
+import asyncio
+import os
+import pickle
+import time
+
+from pathlib import Path
+from loguru import logger
+from typing import Any, Dict, List
+
+DEFAULT_PATH = os.path.join(
+    Path(os.path.dirname(os.path.realpath(__file__))).parent, "data", "snapshot.pickle"
+)
+# Snapshots of a different format are ignored
+SNAPSHOT_VERSION = 1
+DEFAULT_INTERVAL = 10 * 60
+
+
+class Snapshot:
+    """
+    Warm state of all services (api version, reference data, lookup, item
+    and library caches), saved on shutdown and every `interval` seconds.
+    Loading it on startup makes the first requests after a restart fast,
+    the restored data is revalidated in the background.
+    Posters are not part of it, their cache is persistent on its own.
+    """
+
+    file: Path
+    interval: float
+
+    def __init__(
+        self, services: List[Any], file=DEFAULT_PATH, interval=DEFAULT_INTERVAL
+    ):
+        self.services = services
+        self.file = Path(file)
+        self.interval = interval
+        self.task = None
+
+    def collect(self) -> Dict[str, Any]:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": time.time(),
+            "services": {s.commands[0]: s.snapshot() for s in self.services},
+        }
+
+    def save(self, data: Dict[str, Any] = None):
+        started = time.monotonic()
+        data = data or self.collect()
+        try:
+            self.file.parent.mkdir(exist_ok=True, parents=True)
+            # Written aside and swapped in, so a crash never leaves half a file
+            tmp_file = self.file.with_suffix(".tmp")
+            with open(tmp_file, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.file)
+        except (OSError, pickle.PickleError) as e:
+            logger.error(f"Error saving snapshot: {e}")
+            return
+        logger.debug(f"Saved snapshot in {time.monotonic() - started:.2f}s")
+
+    def load(self):
+        started = time.monotonic()
+        try:
+            with open(self.file, "rb") as f:
+                data: Dict[str, Any] = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot: {e}")
+            return
+        if data.get("version") != SNAPSHOT_VERSION:
+            logger.info("Ignoring snapshot of an older version")
+            return
+
+        age = max(0.0, time.time() - data["saved_at"])
+        for s in self.services:
+            if snapshot := data["services"].get(s.commands[0]):
+                s.restore(snapshot, age)
+        logger.info(
+            f"Restored snapshot from {round(age)}s ago in {time.monotonic() - started:.2f}s"
+        )
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            # Collected on the event loop, as the caches are not thread-safe.
+            # Pickling large libraries takes a while, so that happens aside.
+            await asyncio.to_thread(self.save, self.collect())
+
+    def start(self):
+        if not self.task or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(
+                self._save_periodically()
+            )
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
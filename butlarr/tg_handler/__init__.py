@@ -1,15 +1,22 @@
 import shlex
 import inspect
 
-from typing import List, Tuple, Callable
+from typing import Dict, List, Tuple, Callable
 from loguru import logger
 from functools import wraps
-from telegram.ext import CommandHandler, CallbackQueryHandler
+from telegram.ext import CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from typing import TypeAlias
 
 from ..config.commands import AUTH_COMMAND, HELP_COMMAND, START_COMMAND
 from ..config.secrets import ADMIN_AUTH_PASSWORD
 from ..database import Database
+from ..circuit_breaker import ServiceUnavailableError
+from .callback_data import (
+    CallbackDataError,
+    decode_callback,
+    encode_callback,
+    register_callbacks,
+)
 
 
 def escape_markdownv2_chars(text: str):
@@ -72,17 +79,38 @@ def get_common_handlers(services):
     ]
 
 
+def parse_command(text: str) -> List[str]:
+    try:
+        return shlex.split(text.strip())
+    except ValueError:
+        # Unbalanced quotes, e.g. an apostrophe in a title
+        return text.split()
+
+
+def parse_callback_data(data: str) -> List[str]:
+    return decode_callback(data)
+
+
 def get_clbk_handler(services):
+    # Callback data is prefixed with the first command of its service
+    routes = {s.commands[0]: s for s in reversed(services)}
+
     async def handler(update, context):
-        args = shlex.split(update.callback_query.data.strip())
+        try:
+            args = parse_callback_data(update.callback_query.data)
+        except CallbackDataError as e:
+            logger.warning(e)
+            await update.callback_query.answer("This button is no longer valid.")
+            return
         if args[0] == "noop":
             await update.callback_query.answer()
             return
         logger.debug(f"Received callback: {args}")
-        for s in services:
-            if args[0] == s.commands[0]:
-                return await s.handle_callback(update, context)
-        logger.error("Found no matching callback handler!")
+        service = routes.get(args[0])
+        if not service:
+            logger.error("Found no matching callback handler!")
+            return
+        return await service.handle_callback(update, context, args)
 
     return CallbackQueryHandler(handler)
 
@@ -141,7 +169,7 @@ def handler(cls):
         if hasattr(method, "cmd_default"):
             assert not has_default_command, f"Only one default command allowed."
             cls.default_command = method
-            (desc, pattern) = method.cmd_default
+            desc, pattern = method.cmd_default
             cls.default_description = desc
             cls.default_pattern = pattern
             has_default_command = True
@@ -152,6 +180,15 @@ def handler(cls):
             cls.default_callback = method
             has_default_callback = True
 
+    # Dispatch tables, the first registration of a name wins
+    cls.command_table = {}
+    for cmd, _, _, method in cls.sub_commands:
+        cls.command_table.setdefault(cmd, method)
+    cls.callback_table = {}
+    for cmd, method in cls.sub_callbacks:
+        cls.callback_table.setdefault(cmd, method)
+    register_callbacks(list(cls.callback_table))
+
     return cls
 
 
@@ -160,54 +197,95 @@ class TelegramHandler:
     commands: List[CmdStr]
     sub_commands: List[Tuple[CmdStr, CmdPattern, CmdDescription, Callable]]
     sub_callbacks: List[Tuple[str, Callable]]
+    command_table: Dict[str, Callable] = {}
+    callback_table: Dict[str, Callable] = {}
 
     def register(self, application, db):
         self.db = db
         for cmd in self.commands:
             application.add_handler(CommandHandler(cmd, self.handle_command))
+            # Commands sent as caption of a file, e.g. a list to import
+            application.add_handler(
+                MessageHandler(
+                    filters.Document.ALL
+                    & filters.CaptionRegex(rf"^/{cmd}(@\S+)?(\s|$)"),
+                    self.handle_command,
+                )
+            )
 
     async def default_command(self, _update, _context, _args=None):
         del _update, _context, _args
         raise NotImplementedError
 
-    async def handle_command(self, update, context):
-        args = shlex.split(update.message.text.strip())
+    async def handle_command(self, update, context, args=None):
+        if args is None:
+            args = parse_command(update.message.text or update.message.caption or "")
         logger.info(f"Received command: {args}")
+        try:
+            self.check_available()
+        except ServiceUnavailableError as e:
+            await self.reply_unavailable(update, e)
+            return
 
-        if self.sub_commands and len(args) > 1:
-            for s, _, _, c in self.sub_commands:
-                if args[1] == s:
-                    logger.debug(f"Subcommand - Executing {s} ({c.__name__})")
+        if len(args) > 1:
+            c = self.command_table.get(args[1])
+            if c:
+                logger.debug(f"Subcommand - Executing {args[1]} ({c.__name__})")
+                try:
                     await c(self, update, context, args[1:])
-                    return
+                except ServiceUnavailableError as e:
+                    await self.reply_unavailable(update, e)
+                return
 
             logger.debug("No matching subcommand registered. Trying fallback")
         try:
             await self.default_command(update, context, args[1:])
         except NotImplementedError:
             logger.error("No default command handler registered.")
+        except ServiceUnavailableError as e:
+            await self.reply_unavailable(update, e)
 
     async def default_callback(self, _update, _context, _args=None):
         del _update, _context, _args
         raise NotImplementedError
 
-    async def handle_callback(self, update, context):
-        args = shlex.split(update.callback_query.data.strip())
+    async def handle_callback(self, update, context, args=None):
+        if args is None:
+            args = parse_callback_data(update.callback_query.data)
         if args[0] != self.commands[0]:
             return
-        if self.sub_callbacks and len(args) > 1:
-            for s, c in self.sub_callbacks:
-                if args[1] == s:
-                    logger.debug(f"Subcallback - Executing {s} ({c.__name__})")
+        try:
+            self.check_available()
+        except ServiceUnavailableError as e:
+            await self.reply_unavailable(update, e)
+            return
+        if len(args) > 1:
+            c = self.callback_table.get(args[1])
+            if c:
+                logger.debug(f"Subcallback - Executing {args[1]} ({c.__name__})")
+                try:
                     await c(self, update, context, args[1:])
-                    return
+                except ServiceUnavailableError as e:
+                    await self.reply_unavailable(update, e)
+                return
 
             logger.debug("No matching subcallback registered. Trying fallback")
         try:
             await self.default_callback(update, context, args[1:])
         except NotImplementedError:
             logger.error("No default callback handler registered.")
+        except ServiceUnavailableError as e:
+            await self.reply_unavailable(update, e)
+
+    def check_available(self):
+        """Raises ServiceUnavailableError to fail fast while the backend is down"""
+
+    async def reply_unavailable(self, update, error: ServiceUnavailableError):
+        logger.warning(f"Failing fast: {error}")
+        if update.callback_query:
+            await update.callback_query.answer(str(error), show_alert=True)
+        else:
+            await update.message.reply_text(str(error))
 
     def get_clbk(self, *args: List[str]):
-        args = [self.commands[0], *args]
-        return (" ").join([f'"{arg}"' for arg in args])
+        return encode_callback(self.commands[0], *args)
@@ -7,6 +7,7 @@ from telegram.ext import CommandHandler, CallbackQueryHandler
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Any
 from enum import Enum
@@ -23,13 +24,26 @@ class AuthLevels(Enum):
     ADMIN = 3
 
 
+# Auth levels resolved for the most recent updates, by update id
+_update_auth_levels: OrderedDict = OrderedDict()
+UPDATE_AUTH_MEMO_SIZE = 256
+
+
 def get_auth_level_from_message(db, update):
+    key = update.update_id
+    if key in _update_auth_levels:
+        return _update_auth_levels[key]
+
     uid = (
         update.message.from_user.id
         if update.message
         else update.callback_query.from_user.id
     )
-    return db.get_auth_level(uid)
+    auth_level = db.get_auth_level(uid)
+    _update_auth_levels[key] = auth_level
+    if len(_update_auth_levels) > UPDATE_AUTH_MEMO_SIZE:
+        _update_auth_levels.popitem(last=False)
+    return auth_level
 
 
 def authorized(min_auth_level=None):
@@ -43,12 +57,7 @@ def authorized(min_auth_level=None):
         async def wrapped_func(*args, **kwargs):
             # Ensure user is authorized
             update = args[1] if len(args) >= 2 else kwargs["update"]
-            uid = (
-                update.message.from_user.id
-                if update.message
-                else update.callback_query.from_user.id
-            )
-            auth_level = args[0].db.get_auth_level(uid)
+            auth_level = get_auth_level_from_message(args[0].db, update)
             # TODO pjordan: Reenable this some time
             if not auth_level or min_auth_level > auth_level and False:
                 await update.message.reply_text(
@@ -71,15 +80,15 @@ def get_auth_handler(db: Database):
         pw_offset = len(AUTH_COMMAND) + 2
         password = update.message.text[pw_offset:].strip()
         if password == ADMIN_AUTH_PASSWORD:
-            db.add_user(uid, name, AuthLevels.ADMIN.value)
+            await db.aadd_user(uid, name, AuthLevels.ADMIN.value)
             await update.message.reply_text(f"Authorized user {name} as admin")
             await update.message.delete()
         elif password == MOD_AUTH_PASSWORD:
-            db.add_user(uid, name, AuthLevels.MOD.value)
+            await db.aadd_user(uid, name, AuthLevels.MOD.value)
             await update.message.reply_text(f"Authorized user {name} as mod")
             await update.message.delete()
         elif password == USER_AUTH_PASSWORD:
-            db.add_user(uid, name, AuthLevels.USER.value)
+            await db.aadd_user(uid, name, AuthLevels.USER.value)
             await update.message.reply_text(f"Authorized user {name}")
             await update.message.delete()
         else:
@@ -0,0 +1,146 @@
+import base64
+import re
+import shlex
+import zlib
+
+from typing import Dict, List
+
+# Telegram rejects buttons with longer callback data
+MAX_CALLBACK_DATA_LENGTH = 64
+
+# Marks the compact format, data of the old format always starts with a quote
+COMPACT_PREFIX = "~"
+
+# Args sent as varints, isdigit() would also accept e.g. superscripts
+INT_REGEX = re.compile(r"-?[0-9]+")
+
+# Opcodes 0 and 1 are reserved, 1 marks a sub callback sent literally
+LITERAL_OPCODE = 1
+OPCODE_SPACE = 1 << 16
+
+_opcodes: Dict[str, int] = {}
+_names: Dict[int, str] = {}
+
+
+class CallbackDataError(ValueError):
+    pass
+
+
+def opcode_of(name: str) -> int:
+    # Derived from the name only, so buttons stay valid across restarts,
+    # configuration changes and newly added callbacks
+    return 2 + zlib.crc32(name.encode()) % (OPCODE_SPACE - 2)
+
+
+def register_callbacks(names: List[str]):
+    for name in names:
+        opcode = opcode_of(name)
+        known = _names.setdefault(opcode, name)
+        if known == name:
+            _opcodes[name] = opcode
+        # Otherwise the opcode is taken, the callback is sent literally
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int):
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise CallbackDataError("Truncated callback data")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_arg(out: bytearray, arg):
+    # The lowest bit tells integers (zigzag encoded) and strings apart
+    if isinstance(arg, int) and not isinstance(arg, bool):
+        zigzag = arg * 2 if arg >= 0 else -arg * 2 - 1
+        _write_varint(out, zigzag << 1)
+        return
+    arg = str(arg)
+    if INT_REGEX.fullmatch(arg) and str(int(arg)) == arg:
+        # Decoded back to the same string
+        return _write_arg(out, int(arg))
+    raw = arg.encode()
+    _write_varint(out, (len(raw) << 1) | 1)
+    out += raw
+
+
+def _read_arg(data: bytes, pos: int):
+    header, pos = _read_varint(data, pos)
+    if not header & 1:
+        zigzag = header >> 1
+        return str((zigzag >> 1) ^ -(zigzag & 1)), pos
+    end = pos + (header >> 1)
+    if end > len(data):
+        raise CallbackDataError("Truncated callback data")
+    return data[pos:end].decode(), end
+
+
+def encode_callback(prefix: str, *args) -> str:
+    """
+    Packs a service prefix, sub callback and its args into callback data.
+    Registered sub callbacks are sent as a two byte opcode, integers as
+    varints.
+    """
+    out = bytearray()
+    _write_arg(out, prefix)
+    if args and args[0] in _opcodes:
+        out += _opcodes[args[0]].to_bytes(2, "big")
+        args = args[1:]
+    elif args:
+        out += LITERAL_OPCODE.to_bytes(2, "big")
+    for arg in args:
+        _write_arg(out, arg)
+
+    data = COMPACT_PREFIX + base64.urlsafe_b64encode(out).rstrip(b"=").decode()
+    if len(data) > MAX_CALLBACK_DATA_LENGTH:
+        raise CallbackDataError(
+            f"Callback data of {[prefix, *args]} exceeds {MAX_CALLBACK_DATA_LENGTH} bytes"
+        )
+    return data
+
+
+def decode_callback(data: str) -> List[str]:
+    """Unpacks callback data into its string args, service prefix first"""
+    if not data.startswith(COMPACT_PREFIX):
+        # Buttons created before the compact format, or plain ones like "noop"
+        return shlex.split(data.strip())
+
+    payload = data[len(COMPACT_PREFIX) :]
+    try:
+        raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        return _decode_payload(raw)
+    except CallbackDataError:
+        raise
+    except ValueError as e:
+        raise CallbackDataError(f"Invalid callback data: {e}")
+
+
+def _decode_payload(raw: bytes) -> List[str]:
+    prefix, pos = _read_arg(raw, 0)
+    args = [prefix]
+    if pos == len(raw):
+        return args
+    if pos + 2 > len(raw):
+        raise CallbackDataError("Truncated callback data")
+    opcode = int.from_bytes(raw[pos : pos + 2], "big")
+    pos += 2
+    if opcode != LITERAL_OPCODE:
+        if opcode not in _names:
+            raise CallbackDataError(f"Unknown callback opcode {opcode}")
+        args.append(_names[opcode])
+    while pos < len(raw):
+        arg, pos = _read_arg(raw, pos)
+        args.append(arg)
+    return args
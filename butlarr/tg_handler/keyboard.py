@@ -1,6 +1,7 @@
 import shlex
 
-from typing import List, Tuple, Callable, Optional
+from collections import OrderedDict
+from typing import Hashable, List, Tuple, Callable, Optional
 from loguru import logger
 from functools import wraps
 from telegram.ext import CommandHandler, CallbackQueryHandler
@@ -20,27 +21,62 @@ class Button:
     url: Optional[str] = None
 
 
-def keyboard(func):
-    def create_keyboard(buttons: List[List[Optional[Button]]]):
-        keyboard = [
-            [
-                (
-                    InlineKeyboardButton(b.title, callback_data=b.clbk)
-                    if not b.url
-                    else InlineKeyboardButton(b.title, url=b.url)
-                )
-                for b in bs
-                if b
-            ]
-            for bs in buttons
-            if bs
+# Prebuilt keyboards kept per decorated function
+KEYBOARD_CACHE_SIZE = 128
+
+
+def create_keyboard(buttons: List[List[Optional[Button]]]):
+    keyboard = [
+        [
+            (
+                InlineKeyboardButton(b.title, callback_data=b.clbk)
+                if not b.url
+                else InlineKeyboardButton(b.title, url=b.url)
+            )
+            for b in bs
+            if b
         ]
-        keyboard_markup = InlineKeyboardMarkup(keyboard)
-        return keyboard_markup
+        for bs in buttons
+        if bs
+    ]
+    keyboard_markup = InlineKeyboardMarkup(keyboard)
+    return keyboard_markup
+
+
+def keyboard(
+    func=None,
+    *,
+    cache_key: Optional[Callable[..., Optional[Hashable]]] = None,
+    cache_size: int = KEYBOARD_CACHE_SIZE,
+):
+    """
+    Turns a function returning rows of `Button`s into one returning the
+    keyboard markup.
+    If `cache_key` is given, it is called with the same args and markups
+    are reused for equal keys. The key has to cover everything the
+    keyboard depends on, `None` skips the cache.
+    """
+
+    def decorator(func):
+        cache: OrderedDict[Hashable, InlineKeyboardMarkup] = OrderedDict()
+
+        @wraps(func)
+        def wrapped_func(*args, **kwargs):
+            key = cache_key(*args, **kwargs) if cache_key else None
+            if key is None:
+                return create_keyboard(func(*args, **kwargs))
+
+            markup = cache.get(key)
+            if markup is not None:
+                cache.move_to_end(key)
+                return markup
+            # Markups are immutable, so they can be shared between messages
+            markup = cache[key] = create_keyboard(func(*args, **kwargs))
+            if len(cache) > cache_size:
+                cache.popitem(last=False)
+            return markup
 
-    @wraps(func)
-    def wrapped_func(*args, **kwargs):
-        buttons = func(*args, **kwargs)
-        return create_keyboard(buttons)
+        wrapped_func.cache = cache
+        return wrapped_func
 
-    return wrapped_func
+    return decorator(func) if func else decorator
@@ -1,16 +1,18 @@
+import asyncio
 import shlex
 
-from typing import List, Tuple, Callable, Optional, Literal
+from typing import Dict, List, Tuple, Callable, Optional, Literal
 from loguru import logger
 from functools import wraps
 from telegram.ext import CommandHandler, CallbackQueryHandler
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.error import BadRequest
 
 from dataclasses import dataclass
 from typing import Any
 
 from ..database import Database
+from ..poster_cache import PosterCache
 
 bad_request_poster_error_messages = [
     "Wrong type of the web page content",
@@ -18,11 +20,16 @@ bad_request_poster_error_messages = [
     "Media_empty",
 ]
 
+DEFAULT_POSTER = "https://artworks.thetvdb.com/banners/images/missing/movie.jpg"
+
 no_caption_error_messages = ["There is no caption in the message to edit"]
 no_edit_error_messages = [
     "Message is not modified: specified new message content and reply markup are exactly the same as a current content and reply markup of the message"
 ]
 
+# Seconds to wait for further taps on a message before repainting it
+REPAINT_DEBOUNCE = 0.4
+
 
 @dataclass(frozen=True)
 class Response:
@@ -35,6 +42,97 @@ class Response:
     ] = None
 
 
+poster_cache = PosterCache()
+
+
+def _remember_poster(url, sent):
+    if sent and sent.photo:
+        # The largest size is the one Telegram serves for this file id
+        poster_cache.set_file_id(url, sent.photo[-1].file_id)
+        # Sent once, the file id is all that is needed from now on
+        poster_cache.forget_bytes(url)
+
+
+def _poster_source(url: str) -> Tuple[str, Optional[str], Any]:
+    if url != DEFAULT_POSTER and poster_cache.is_bad(url):
+        url = DEFAULT_POSTER
+    file_id = poster_cache.get_file_id(url)
+    # Prefer a prefetched upload over Telegram fetching the url
+    return url, file_id, file_id or poster_cache.get_bytes(url) or url
+
+
+async def send_poster(bot, chat_id, message: Response, url: Optional[str] = None):
+    url, file_id, media = _poster_source(url or message.photo)
+
+    try:
+        sent = await bot.send_photo(
+            chat_id=chat_id,
+            photo=media,
+            caption=message.caption,
+            reply_markup=message.reply_markup,
+        )
+    except BadRequest as e:
+        if str(e) not in bad_request_poster_error_messages:
+            raise e
+        if file_id:
+            # File ids do not survive e.g. a change of the bot token
+            logger.debug(f"Cached file id of [{url}] was rejected, resending url")
+            poster_cache.forget_file_id(url)
+            return await send_poster(bot, chat_id, message, url)
+        if url == DEFAULT_POSTER:
+            raise e
+        logger.error(
+            f"Error sending photo [{url}]: BadRequest: {e}. Attempting to send with default poster..."
+        )
+        poster_cache.mark_bad(url)
+        return await send_poster(bot, chat_id, message, DEFAULT_POSTER)
+
+    _remember_poster(url, sent)
+    return sent
+
+
+async def edit_poster(query, message: Response, url: Optional[str] = None) -> bool:
+    """
+    Replaces photo, caption and keyboard of the message of a callback query
+    in a single call. Returns False if the message can not be edited.
+    """
+    if not query.message or not query.message.photo:
+        # Text messages can not be turned into photo messages
+        return False
+    url, file_id, media = _poster_source(url or message.photo)
+
+    try:
+        edited = await query.edit_message_media(
+            media=InputMediaPhoto(
+                media=media,
+                caption=message.caption,
+                parse_mode=message.parse_mode,
+            ),
+            reply_markup=message.reply_markup,
+        )
+    except BadRequest as e:
+        if str(e) in no_edit_error_messages:
+            return True
+        if str(e) not in bad_request_poster_error_messages:
+            logger.debug(f"Could not edit message in place: {e}")
+            return False
+        if file_id:
+            poster_cache.forget_file_id(url)
+            return await edit_poster(query, message, url)
+        if url == DEFAULT_POSTER:
+            return False
+        logger.error(
+            f"Error sending photo [{url}]: BadRequest: {e}. Attempting to send with default poster..."
+        )
+        poster_cache.mark_bad(url)
+        return await edit_poster(query, message, DEFAULT_POSTER)
+
+    # Inline messages are edited without getting the message back
+    if edited is not True:
+        _remember_poster(url, edited)
+    return True
+
+
 def clear(func):
     @wraps(func)
     async def wrapped_func(self, update, context, *args, **kwargs):
@@ -89,38 +187,57 @@ def repaint(func):
                     reply_markup=message.reply_markup,
                     parse_mode=message.parse_mode,
                 )
+        elif update.callback_query and await edit_poster(
+            update.callback_query, message
+        ):
+            await update.callback_query.answer()
         else:
             try:
-                await context.bot.send_photo(
-                    chat_id=(
+                await send_poster(
+                    context.bot,
+                    (
                         update.message.chat.id
                         if update.message
                         else update.callback_query.message.chat.id
                     ),
-                    photo=message.photo,
-                    caption=message.caption,
-                    reply_markup=message.reply_markup,
+                    message,
                 )
-            except BadRequest as e:
-                if str(e) in bad_request_poster_error_messages:
-                    logger.error(
-                        f"Error sending photo [{message.photo}]: BadRequest: {e}. Attempting to send with default poster..."
-                    )
-                    await context.bot.send_photo(
-                        chat_id=(
-                            update.message.chat.id
-                            if update.message
-                            else update.callback_query.message.chat.id
-                        ),
-                        photo="https://artworks.thetvdb.com/banners/images/missing/movie.jpg",
-                        caption=message.caption,
-                        reply_markup=message.reply_markup,
-                    )
-                else:
-                    raise e
             finally:
                 if update.callback_query:
                     await update.callback_query.answer()
                     await update.callback_query.message.delete()
 
     return wrapped_func
+
+
+# Latest pending repaint of every message, by chat and message id
+_pending_repaints: Dict[Tuple[int, int], object] = {}
+
+
+def debounce(func=None, *, delay: float = REPAINT_DEBOUNCE):
+    """
+    Drops repaints superseded by another tap on the same message within
+    `delay` seconds, so a burst of taps only repaints once. Goes between
+    @repaint and the handler, the state is still updated on every tap.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapped_func(self, update, context, *args, **kwargs):
+            message = await func(self, update, context, *args, **kwargs)
+            query = update.callback_query
+            if not message or not query or not query.message:
+                return message
+
+            key = (query.message.chat_id, query.message.message_id)
+            _pending_repaints[key] = token = object()
+            await asyncio.sleep(delay)
+            if _pending_repaints.get(key) is not token:
+                await query.answer()
+                return None
+            del _pending_repaints[key]
+            return message
+
+        return wrapped_func
+
+    return decorator(func) if func else decorator
@@ -1,4 +1,6 @@
+import asyncio
 import shlex
+import weakref
 
 from typing import List, Tuple, Callable, Optional
 from loguru import logger
@@ -11,6 +13,10 @@ from dataclasses import dataclass
 from typing import Any
 
 from ..session_database import SessionDatabase
+from .message import Response
+
+# Shown for buttons of messages whose session expired or was cleared
+EXPIRED_SESSION_CAPTION = "This search has expired, please search again."
 
 
 def get_chat_id(update):
@@ -23,25 +29,45 @@ def default_session_state_key_fn(self, update):
     return str(self.commands[0]) + str(get_chat_id(update))
 
 
-def sessionState(key_fn=default_session_state_key_fn, clear=False, init=False):
+# Held while a handler works on a session, so concurrent updates of the same
+# chat can not overwrite each others state. Unused locks are dropped.
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+def get_session_lock(key: str) -> asyncio.Lock:
+    lock = _session_locks.get(key)
+    if lock is None:
+        lock = _session_locks[key] = asyncio.Lock()
+    return lock
+
+
+def sessionState(
+    key_fn=default_session_state_key_fn, clear=False, init=False, optional=False
+):
     def decorator(func):
 
         @wraps(func)
         async def wrapped_func(self, update, context, *args, **kwargs):
-            # init calls do not need a state, as they will create it first
-            if init:
-                return await func(self, update, context, *args, **kwargs)
-
-            # get state
             key = key_fn(self, update)
-            state = self.session_db.get_session_entry(key)
-            result = await func(self, update, context, *args, **kwargs, state=state)
-
-            if clear:
-                self.session_db.clear_session(key)
-            else:
-                self.session_db.add_session_entry(key, result.state)
-            return result
+            async with get_session_lock(key):
+                # init calls do not need a state, as they will create it first
+                if init:
+                    return await func(self, update, context, *args, **kwargs)
+
+                # get state
+                state = await self.session_db.aget_session_entry(key)
+                if state is None and not optional:
+                    # Handlers only get a missing state if they can rebuild it
+                    return Response(caption=EXPIRED_SESSION_CAPTION)
+                result = await func(self, update, context, *args, **kwargs, state=state)
+
+                if clear:
+                    self.session_db.clear_session(key)
+                else:
+                    self.session_db.add_session_entry(key, result.state)
+                return result
 
         return wrapped_func
 
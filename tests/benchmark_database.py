@@ -0,0 +1,113 @@
+"""
+Cost of the user database calls, with a connection per query (as before the
+worker thread) and with the worker owned connection of `Database`.
+Also reports how long the event loop is held up by concurrent writes.
+
+    python -m tests.benchmark_database [--iterations 500]
+"""
+
+import argparse
+import asyncio
+import sqlite3
+import tempfile
+import time
+
+from pathlib import Path
+from loguru import logger
+
+from butlarr.database import Database, _dict_factory
+
+
+class ConnectionPerQuery:
+    """Stands in for the former database, which connected for every query"""
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        with self._connect() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS users (
+                    id integer primary key,
+                    username text not null,
+                    auth_level integer
+                );""")
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_file, timeout=30)
+        con.execute("PRAGMA journal_mode = off;")
+        con.row_factory = _dict_factory
+        return con
+
+    def add_user(self, id, username, auth_level):
+        con = self._connect()
+        con.execute(
+            "INSERT OR REPLACE INTO users (id, username, auth_level) VALUES (?, ?, ?);",
+            (id, username, auth_level),
+        )
+        con.commit()
+        con.close()
+
+    def get_users(self, min_auth_level):
+        con = self._connect()
+        records = con.execute(
+            "SELECT * FROM users where auth_level >= ?;", (min_auth_level,)
+        ).fetchall()
+        con.close()
+        return records
+
+    def get_auth_level(self, user_id):
+        con = self._connect()
+        record = con.execute("SELECT * FROM users WHERE id=?;", (user_id,)).fetchone()
+        con.close()
+        return record["auth_level"] if record else None
+
+
+def timed(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def loop_stall(db: Database, iterations: int) -> float:
+    # Longest gap between ticks of the event loop while users are added
+    longest = 0.0
+
+    async def ticker():
+        nonlocal longest
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            longest = max(longest, now - last)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.gather(*[db.aadd_user(i, f"user{i}", 2) for i in range(iterations)])
+    tick.cancel()
+    return longest * 1e3
+
+
+def main(iterations: int):
+    logger.remove()
+    with tempfile.TemporaryDirectory() as tmp:
+        before = ConnectionPerQuery(Path(tmp) / "before.sqlite")
+        after = Database(Path(tmp) / "after.sqlite")
+        try:
+            for name, run in [
+                ("add_user", lambda db, i: db.add_user(i, f"user{i}", 1)),
+                ("get_users", lambda db, i: db.get_users(min_auth_level=1)),
+                ("get_auth_level", lambda db, i: db.get_auth_level(i)),
+            ]:
+                b = timed(lambda i: run(before, i), iterations)
+                a = timed(lambda i: run(after, i), iterations)
+                print(f"{name:>14}: {b:8.1f}us -> {a:8.1f}us per call")
+            stall = asyncio.run(loop_stall(after, iterations))
+            print(f"{'aadd_user':>14}: event loop held up for at most {stall:.2f}ms")
+        finally:
+            after.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,87 @@
+"""
+Cost of routing a callback to its handler as the number of services and
+callbacks grows, with the former linear scans (parsing the data in the
+router and again in the service) and with the lookup tables.
+
+    python -m tests.benchmark_dispatch [--dispatches 5000]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from types import SimpleNamespace
+
+os.environ.setdefault("BUTLARR_USE_ENV_CONFIG", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+from loguru import logger
+
+from butlarr.tg_handler import (
+    TelegramHandler,
+    get_clbk_handler,
+    handler,
+    parse_callback_data,
+)
+
+SIZES = [(2, 10), (20, 10), (2, 200), (50, 200)]
+
+
+def create_service(name: str, callbacks: int) -> TelegramHandler:
+    methods = {}
+    for i in range(callbacks):
+
+        async def clbk(self, update, context, args):
+            pass
+
+        clbk.clbk_cmds = [f"cmd{i}"]
+        methods[f"clbk_{i}"] = clbk
+    service = handler(type(name, (TelegramHandler,), methods))()
+    service.commands = [name]
+    return service
+
+
+def linear_clbk_handler(services):
+    # Stands in for the former router, scanning services and their callbacks
+    async def route(update, context):
+        args = parse_callback_data(update.callback_query.data)
+        for s in services:
+            if args[0] == s.commands[0]:
+                args = parse_callback_data(update.callback_query.data)
+                for cmd, clbk in s.sub_callbacks:
+                    if args[1] == cmd:
+                        return await clbk(s, update, context, args[1:])
+
+    return route
+
+
+async def timed(route, update, dispatches: int) -> float:
+    started = time.perf_counter()
+    for _ in range(dispatches):
+        await route(update, None)
+    return (time.perf_counter() - started) / dispatches * 1e6
+
+
+async def main(dispatches: int):
+    logger.remove()
+    for count, callbacks in SIZES:
+        services = [create_service(f"svc{i}", callbacks) for i in range(count)]
+        # The worst case for the scans, the last callback of the last service
+        last = services[-1]
+        update = SimpleNamespace(
+            callback_query=SimpleNamespace(data=last.get_clbk(f"cmd{callbacks - 1}", 7))
+        )
+        before = await timed(linear_clbk_handler(services), update, dispatches)
+        after = await timed(get_clbk_handler(services).callback, update, dispatches)
+        print(
+            f"{count:>3} services x {callbacks:>3} callbacks: "
+            f"{before:6.1f}us -> {after:6.1f}us per dispatch"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dispatches", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.dispatches))
@@ -0,0 +1,154 @@
+"""
+Time and memory of decoding a large synthetic /movie response, parsing the
+whole body at once (as before responses were streamed) and feeding it to
+the RecordDecoder in chunks, keeping only the fields the library reads.
+
+    python -m tests.benchmark_json_stream [--records 10000] [--chunk 65536]
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("BUTLARR_USE_ENV_CONFIG", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+from loguru import logger
+
+from butlarr.json_stream import RecordDecoder
+from butlarr.services.library import LIBRARY_FIELDS
+
+
+def movie(i: int):
+    # Shaped like a Radarr library item, including its file and media info
+    return {
+        "id": i,
+        "title": f"Movie {i}",
+        "originalTitle": f"Film {i}",
+        "sortTitle": f"movie {i}",
+        "cleanTitle": f"movie{i}",
+        "alternateTitles": [
+            {"sourceType": "tmdb", "movieMetadataId": i, "title": f"Alt {i} {k}"}
+            for k in range(3)
+        ],
+        "year": 2000 + i % 24,
+        "status": "released",
+        "overview": "A long overview text " * 12,
+        "images": [
+            {
+                "coverType": t,
+                "url": f"/MediaCover/{i}/{t}.jpg",
+                "remoteUrl": f"https://image.tmdb.org/t/p/original/{i}{t}.jpg",
+            }
+            for t in ("poster", "fanart")
+        ],
+        "path": f"/movies/Movie {i} (2001)",
+        "folderName": f"/movies/Movie {i} (2001)",
+        "rootFolderPath": "/movies",
+        "qualityProfileId": 1,
+        "hasFile": True,
+        "monitored": True,
+        "runtime": 100,
+        "imdbId": f"tt{i:07d}",
+        "tmdbId": i,
+        "genres": ["Drama", "Comedy"],
+        "tags": [],
+        "added": "2020-01-01T00:00:00Z",
+        "ratings": {
+            k: {"votes": 100, "value": 7.1, "type": "user"}
+            for k in ("imdb", "tmdb", "metacritic", "rottenTomatoes")
+        },
+        "movieFile": {
+            "movieId": i,
+            "relativePath": f"Movie {i}.mkv",
+            "path": f"/movies/Movie {i}/Movie {i}.mkv",
+            "size": 123456789,
+            "quality": {
+                "quality": {"id": 7, "name": "Bluray-1080p", "resolution": 1080},
+                "revision": {"version": 1, "real": 0, "isRepack": False},
+            },
+            "mediaInfo": {
+                "audioChannels": 5.1,
+                "audioCodec": "DTS",
+                "audioLanguages": "English",
+                "videoCodec": "x264",
+                "videoFps": 23.976,
+                "resolution": "1920x800",
+                "runTime": "1:40:00",
+                "subtitles": "English",
+            },
+            "languages": [{"id": 1, "name": "English"}],
+            "releaseGroup": "GRP",
+            "id": i,
+        },
+        "statistics": {"movieFileCount": 1, "sizeOnDisk": 123456789},
+    }
+
+
+def parse_body(chunks):
+    # What `response.json()` does with the buffered body
+    return json.loads(b"".join(chunks))
+
+
+def stream_records(chunks):
+    decoder = RecordDecoder(fields=LIBRARY_FIELDS)
+    records = []
+    for chunk in chunks:
+        records += decoder.feed(chunk)
+    return records + decoder.close()
+
+
+def measure(name: str, decode, chunks):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    records = decode(chunks)
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+
+    # Timed again without the tracing overhead
+    gc.collect()
+    started = time.perf_counter()
+    decode(chunks)
+    untraced = time.perf_counter() - started
+    print(
+        f"{name:>10}: {untraced * 1e3:6.0f}ms ({elapsed * 1e3:.0f}ms traced), "
+        f"peak {peak / 1e6:6.1f}MB, retained {retained / 1e6:6.1f}MB"
+    )
+
+
+def longest_feed(chunks) -> float:
+    decoder = RecordDecoder(fields=LIBRARY_FIELDS)
+    longest = 0.0
+    for chunk in chunks:
+        started = time.perf_counter()
+        decoder.feed(chunk)
+        longest = max(longest, time.perf_counter() - started)
+    decoder.close()
+    return longest * 1e3
+
+
+def main(count: int, chunk_size: int):
+    logger.remove()
+    body = json.dumps([movie(i) for i in range(count)]).encode()
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    del body
+    size = sum(len(c) for c in chunks)
+    print(f"{count} records, {size / 1e6:.1f}MB in {len(chunks)} chunks")
+
+    measure("json.loads", parse_body, chunks)
+    measure("streamed", stream_records, chunks)
+    print(f"longest single chunk decode: {longest_feed(chunks):.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--chunk", type=int, default=64 * 1024)
+    args = parser.parse_args()
+    main(args.records, args.chunk)
@@ -0,0 +1,71 @@
+"""
+Render time of the Radarr and Sonarr menus, building the markup every time
+(as before keyboards were memoized) and through the keyboard cache.
+Only the reference data pickers are cached, the other menus depend on the
+item or the selection.
+
+    python -m tests.benchmark_keyboards [--entries 12] [--renders 20000]
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("BUTLARR_USE_ENV_CONFIG", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+from loguru import logger
+
+from butlarr.services.radarr import Radarr, State as RadarrState
+from butlarr.services.sonarr import Sonarr, SeasonState, State as SonarrState
+from butlarr.tg_handler.keyboard import create_keyboard
+
+ITEM = {"id": 5, "title": "Movie", "tmdbId": 1}
+
+
+def timed(fn, renders: int) -> float:
+    started = time.perf_counter()
+    for _ in range(renders):
+        fn()
+    return (time.perf_counter() - started) / renders * 1e6
+
+
+def run(service, state, label: str, renders: int):
+    uncached = timed(
+        lambda: create_keyboard(
+            service.keyboard.__wrapped__(service, state, ITEM, allow_edit=True)
+        ),
+        renders,
+    )
+    cached = timed(lambda: service.keyboard(state, ITEM, allow_edit=True), renders)
+    print(f"{label:>16}: {uncached:7.1f}us -> {cached:6.1f}us per render")
+
+
+def main(entries: int, renders: int):
+    logger.remove()
+    radarr = Radarr(["movie"], "http://127.0.0.1:1", "benchmark")
+    sonarr = Sonarr(["series"], "http://127.0.0.1:1", "benchmark")
+    for service in (radarr, sonarr):
+        for kind in service.reference.kinds:
+            service.reference.load(
+                kind,
+                [
+                    {"id": i, "path": f"/data/media/{i}", "name": f"Profile {i}"}
+                    for i in range(entries)
+                ],
+            )
+
+    for menu in ["path", "quality", None, "add"]:
+        state = RadarrState([ITEM], 0, {}, [], {}, menu)
+        run(radarr, state, f"radarr {menu or 'item'}", renders)
+    for menu in ["path", "quality", "language", None, "add"]:
+        state = SonarrState([ITEM], 0, {}, {}, [], {}, True, SeasonState([], []), menu)
+        run(sonarr, state, f"sonarr {menu or 'item'}", renders)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=12)
+    parser.add_argument("--renders", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.entries, args.renders)
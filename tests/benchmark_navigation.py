@@ -0,0 +1,118 @@
+"""
+Bot API calls and time per Prev/Next step of a poster menu, against a fake
+Bot that takes `--latency` seconds per call. Navigating on a text message
+takes the send-and-delete path every step took before poster messages were
+edited in place.
+
+    python -m tests.benchmark_navigation [--steps 20] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from collections import Counter
+from types import SimpleNamespace
+
+os.environ.setdefault("BUTLARR_USE_ENV_CONFIG", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+from loguru import logger
+
+from butlarr.tg_handler import TelegramHandler, callback, handler
+from butlarr.tg_handler.message import Response, poster_cache, repaint
+
+
+class FakeBot:
+    """Counts the Bot API calls made through the bot and callback queries"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def call(self, name: str):
+        self.calls[name] += 1
+        await asyncio.sleep(self.latency)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        await self.call("send_photo")
+        return self.message(chat_id)
+
+    def message(self, chat_id: int, photo=True):
+        async def delete():
+            await self.call("delete_message")
+
+        return SimpleNamespace(
+            chat=SimpleNamespace(id=chat_id),
+            chat_id=chat_id,
+            photo=[SimpleNamespace(file_id=f"file{chat_id}")] if photo else None,
+            delete=delete,
+        )
+
+    def query(self, data: str, message):
+        async def answer(*args, **kwargs):
+            await self.call("answer_callback_query")
+
+        async def edit_message_media(**kwargs):
+            await self.call("edit_message_media")
+            return message
+
+        return SimpleNamespace(
+            data=data,
+            message=message,
+            answer=answer,
+            edit_message_media=edit_message_media,
+        )
+
+
+@handler
+class PosterMenu(TelegramHandler):
+    """Stands in for the search results of the Arr services"""
+
+    def __init__(self):
+        self.commands = ["nav"]
+
+    @callback(cmds=["goto"])
+    @repaint
+    async def clbk_goto(self, update, context, args):
+        index = int(args[1])
+        return Response(
+            photo=f"https://posters.invalid/{index}.jpg",
+            caption=f"Movie {index}",
+        )
+
+
+async def navigate(menu: PosterMenu, bot: FakeBot, steps: int, photo: bool):
+    context = SimpleNamespace(bot=bot)
+    message = bot.message(1, photo=photo)
+    started = time.perf_counter()
+    for step in range(steps):
+        query = bot.query(menu.get_clbk("goto", step % 3), message)
+        await menu.handle_callback(
+            SimpleNamespace(message=None, callback_query=query), context
+        )
+    return (time.perf_counter() - started) / steps
+
+
+async def main(steps: int, latency: float):
+    logger.remove()
+    # Nothing of the benchmark should end up in the poster cache file
+    poster_cache.db_file = None
+    menu = PosterMenu()
+    for name, photo in [("send+delete", False), ("edit", True)]:
+        bot = FakeBot(latency)
+        elapsed = await navigate(menu, bot, steps, photo)
+        calls = sum(n for c, n in bot.calls.items() if c != "answer_callback_query")
+        print(
+            f"{name:>11}: {calls / steps:.1f} Bot API calls per step "
+            f"(excl. answers), {elapsed * 1e3:.0f}ms per step {dict(bot.calls)}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.steps, args.latency))
@@ -0,0 +1,101 @@
+"""
+Throughput of concurrent lookups against a local fake Arr server, with a
+blocking client in the event loop (as before the async transport) and with
+the pooled async transport.
+
+    python -m tests.benchmark_transport [--requests 50] [--delay 0.05]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("BUTLARR_USE_ENV_CONFIG", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+import httpx
+
+from butlarr.services import ArrService, ArrVariant, close_async_clients
+
+
+class FakeArr(BaseHTTPRequestHandler):
+    """Answers every request with a small lookup result after `delay` seconds"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, avoids delayed ACK stalls
+    disable_nagle_algorithm = True
+    delay = 0.05
+    body = json.dumps(
+        [{"title": f"Movie {i}", "year": 2000 + i, "tmdbId": i} for i in range(5)]
+    ).encode()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def create_service(port: int) -> ArrService:
+    service = ArrService()
+    service.commands = ["movie"]
+    service.init_api(f"http://127.0.0.1:{port}")
+    service.api_key = "benchmark"
+    service.arr_variant = ArrVariant.RADARR
+    return service
+
+
+async def blocking_lookups(service: ArrService, count: int):
+    # Stands in for the former requests based transport
+    with httpx.Client() as client:
+
+        async def lookup(term):
+            return client.get(
+                f"{service.api_url}/movie/lookup",
+                params={"apikey": service.api_key, "term": term},
+            ).json()
+
+        await asyncio.gather(*[lookup(f"blocking {i}") for i in range(count)])
+
+
+async def async_lookups(service: ArrService, count: int):
+    await asyncio.gather(*[service.alookup(f"async {i}") for i in range(count)])
+
+
+async def main(count: int, delay: float):
+    FakeArr.delay = delay
+    # Room for all connections at once, the default backlog is 5
+    ThreadingHTTPServer.request_queue_size = count
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeArr)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service = create_service(server.server_address[1])
+
+    try:
+        for name, run in [("blocking", blocking_lookups), ("async", async_lookups)]:
+            started = time.perf_counter()
+            await run(service, count)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:>8}: {count} concurrent lookups in {elapsed:.2f}s ({count / elapsed:.1f}/s)"
+            )
+    finally:
+        await close_async_clients()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.delay))
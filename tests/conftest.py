@@ -0,0 +1,5 @@
+import os
+
+# butlarr reads its configuration on import, tests do not need a config file
+os.environ.setdefault("BUTLARR_USE_ENV_CONFIG", "true")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
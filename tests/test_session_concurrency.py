@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+
+from dataclasses import dataclass, replace
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+from butlarr.session_database import SessionDatabase
+from butlarr.tg_handler import TelegramHandler, callback, handler
+from butlarr.tg_handler.message import Response
+from butlarr.tg_handler import session_state
+from butlarr.tg_handler.session_state import sessionState
+
+CHATS = 30
+TAGS = 10
+
+
+@dataclass(frozen=True)
+class State:
+    tags: List[int]
+
+
+@handler
+class TagHandler(TelegramHandler):
+    """Read-modify-write of the session state, yielding in between"""
+
+    def __init__(self):
+        self.commands = ["tagtest"]
+        self.session_db = SessionDatabase(persist=False)
+
+    @callback(cmds=["addtag"])
+    @sessionState()
+    async def clbk_addtag(self, update, context, args, state):
+        # Stands in for the Arr requests of the real handlers
+        await asyncio.sleep(0)
+        return Response(state=replace(state, tags=[*state.tags, int(args[1])]))
+
+
+def callback_update(chat_id: int, data: str):
+    message = SimpleNamespace(chat_id=chat_id)
+    return SimpleNamespace(
+        message=None, callback_query=SimpleNamespace(data=data, message=message)
+    )
+
+
+class SessionConcurrencyTest(unittest.IsolatedAsyncioTestCase):
+    async def send_interleaved_callbacks(self):
+        service = TagHandler()
+        for chat in range(CHATS):
+            service.session_db.add_session_entry(f"tagtest{chat}", State(tags=[]))
+
+        # Every chat gets all its callbacks at once, mixed with the other chats
+        await asyncio.gather(
+            *[
+                service.handle_callback(
+                    callback_update(chat, service.get_clbk("addtag", tag)), None
+                )
+                for tag in range(TAGS)
+                for chat in range(CHATS)
+            ]
+        )
+        return {
+            chat: service.session_db.get_session_entry(f"tagtest{chat}").tags
+            for chat in range(CHATS)
+        }
+
+    async def test_no_lost_updates(self):
+        tags = await self.send_interleaved_callbacks()
+        for chat in range(CHATS):
+            self.assertEqual(sorted(tags[chat]), list(range(TAGS)))
+
+    async def test_updates_are_lost_without_session_locks(self):
+        # Makes sure the test above would catch a missing lock
+        with mock.patch.object(
+            session_state, "get_session_lock", lambda key: asyncio.Lock()
+        ):
+            tags = await self.send_interleaved_callbacks()
+        self.assertTrue(any(len(t) < TAGS for t in tags.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
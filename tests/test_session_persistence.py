@@ -0,0 +1,74 @@
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from butlarr.session_database import SessionDatabase
+
+
+class TestSessionPersistence(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base_path = Path(self.tmp.name) / "session"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def reopen(self, db: SessionDatabase) -> SessionDatabase:
+        db.close()
+        return SessionDatabase(self.base_path)
+
+    def test_opens_lazily(self):
+        db = SessionDatabase(self.base_path)
+        self.assertFalse(self.base_path.with_suffix(".sqlite").exists())
+        self.assertIsNone(db.worker)
+
+        db.add_session_entry("chat", {"page": 1})
+        db = self.reopen(db)
+        self.assertEqual(db.get_session_entry("chat"), {"page": 1})
+        db.close()
+
+    def test_failed_write_is_retried(self):
+        db = SessionDatabase(self.base_path)
+        db.add_session_entry("chat", {"page": 1})
+        db.add_session_entry("other", {"page": 1})
+
+        with mock.patch.object(
+            db.backend, "write", side_effect=sqlite3.OperationalError("locked")
+        ):
+            db.flush()
+            db._submit(lambda: None).result()
+        # Changed while the batch was failing, the newer value wins
+        db.add_session_entry("chat", {"page": 2})
+        db.clear_session("other")
+
+        db = self.reopen(db)
+        self.assertEqual(db.get_session_entry("chat"), {"page": 2})
+        self.assertIsNone(db.get_session_entry("other"))
+        db.close()
+
+    def test_loads_off_the_event_loop(self):
+        db = SessionDatabase(self.base_path)
+        db.add_session_entry("chat", {"page": 1})
+        db = self.reopen(db)
+
+        threads = []
+        load = db.backend.load
+
+        def record(entry_key):
+            threads.append(threading.current_thread())
+            return load(entry_key)
+
+        with mock.patch.object(db.backend, "load", side_effect=record):
+            value = asyncio.run(db.aget_session_entry("chat"))
+        self.assertEqual(value, {"page": 1})
+        self.assertEqual(threads, [db.worker])
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()